@@ -0,0 +1,291 @@
+import asyncio
+import inspect
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from storage_backend import _OPERATIONS, _PLAIN_TYPES
+
+# ================= CONFIGURACIÓN =================
+
+# Métodos que hacen un request y que en la capa async se esperan (await)
+_ASYNC_REQUEST_METHODS = {"execute", "upload", "get_public_url"}
+
+# Códigos HTTP que vale la pena reintentar
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_PER_ENDPOINT = 8
+DEFAULT_RETRIES = 4
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 8.0
+
+
+def is_retryable(error, idempotent=True):
+    """
+    Errores transitorios: red, timeouts, 429/5xx y SQLite bloqueado (backend
+    local). Para operaciones no idempotentes (insert) solo se reintenta si el
+    request seguro no llegó a procesarse (conexión fallida, 429, 503).
+    """
+    if not idempotent:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        if isinstance(error, sqlite3.OperationalError):
+            return "locked" in str(error)
+        status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "code", None)
+        return str(status) in ("429", "503")
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUSES
+    if isinstance(error, sqlite3.OperationalError):
+        return "locked" in str(error)
+    code = getattr(error, "code", None)
+    status = getattr(error, "status", None)
+    for value in (code, status):
+        try:
+            if value is not None and int(value) in RETRY_STATUSES:
+                return True
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+def backoff_delay(attempt):
+    """Backoff exponencial con jitter completo (0..base*2^attempt, con tope)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class _EndpointPool:
+    """
+    Semáforos por endpoint (tabla, bucket o host de imágenes) y política de
+    reintentos, compartidos por todos los proxies de un mismo cliente.
+    """
+
+    def __init__(self, per_endpoint, retries, stats, limits=None, limiter=None):
+        self.per_endpoint = per_endpoint
+        self.limiter = limiter
+        self.limits = limits or {}
+        self.retries = retries
+        self.stats = stats
+        self._semaphores = {}
+
+    def semaphore(self, endpoint):
+        sem = self._semaphores.get(endpoint)
+        if sem is None:
+            sem = asyncio.Semaphore(self.limits.get(endpoint, self.per_endpoint))
+            self._semaphores[endpoint] = sem
+        return sem
+
+    async def call(self, endpoint, operation, table, func, record=True):
+        """Ejecuta `func()` (corrutina) con cupo del endpoint y reintentos."""
+        idempotent = operation != "insert"
+        async with self.semaphore(endpoint):
+            attempt = 0
+            while True:
+                if record and self.limiter is not None and self.limiter.rate > 0:
+                    # RateLimiter es bloqueante: se espera fuera del event loop
+                    await asyncio.to_thread(self.limiter.acquire)
+                started = time.perf_counter()
+                try:
+                    return await func()
+                except Exception as e:
+                    if attempt >= self.retries or not is_retryable(e, idempotent):
+                        raise
+                finally:
+                    if record and self.stats is not None:
+                        self.stats.record(operation, table, time.perf_counter() - started)
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+
+
+class AsyncClient:
+    """
+    Proxy async sobre un cliente estilo supabase-py. La cadena fluida
+    (schema/table/select/eq/upsert/...) se arma igual que en la versión
+    sincrónica; solo `execute()`, `upload()` y `get_public_url()` se esperan:
+
+        res = await client.table("Stores").select("Id").eq("Name", name).execute()
+
+    Con un cliente async (httpx) se espera directamente; con uno sincrónico
+    (LocalBackend) la llamada corre en un hilo con asyncio.to_thread. En ambos
+    casos pasa por el cupo del endpoint y por los reintentos con jitter.
+    """
+
+    def __init__(self, target, pool, context=None, blocking=False):
+        self._target = target
+        self._pool = pool
+        self._context = context or {}
+        self._blocking = blocking
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _ASYNC_REQUEST_METHODS:
+            async def request(*args, **kwargs):
+                context = self._context
+                table = context.get("table")
+                operation = context.get("operation") if name == "execute" else name
+                endpoint = context.get("endpoint") or table or name
+
+                async def run():
+                    if self._blocking:
+                        return await asyncio.to_thread(attr, *args, **kwargs)
+                    result = attr(*args, **kwargs)
+                    return await result if inspect.isawaitable(result) else result
+
+                # En modo bloqueante el cliente sincrónico ya registra sus propias estadísticas
+                return await self._pool.call(endpoint, operation, table, run, record=not self._blocking)
+            return request
+        if callable(attr):
+            def call(*args, **kwargs):
+                context = self._context
+                if name in ("table", "from_") and args:
+                    context = {**context, "table": args[0]}
+                elif name in _OPERATIONS:
+                    context = {**context, "operation": name}
+                    if name == "rpc" and args:
+                        context["table"] = args[0]
+                        context["endpoint"] = f"rpc:{args[0]}"
+                return self._wrap(attr(*args, **kwargs), context)
+            return call
+        return self._wrap(attr, self._context)
+
+    def _wrap(self, value, context):
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        return AsyncClient(value, self._pool, context, self._blocking)
+
+
+class _AsyncSupabaseTarget:
+    """
+    Cliente mínimo de Supabase (PostgREST + Storage) sobre UN httpx.AsyncClient
+    con HTTP/2 y keep-alive, compartido entre schemas y storage.
+    """
+
+    def __init__(self, url, key, http_client):
+        from postgrest import AsyncPostgrestClient
+        from storage3 import AsyncStorageClient
+
+        self._url = url.rstrip("/")
+        self._headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self._http = http_client
+        self._postgrest_cls = AsyncPostgrestClient
+        self._schemas = {}
+        self.storage = AsyncStorageClient(f"{self._url}/storage/v1/", dict(self._headers), http_client=http_client)
+
+    def _rest(self, schema_name="public"):
+        client = self._schemas.get(schema_name)
+        if client is None:
+            client = self._postgrest_cls(
+                f"{self._url}/rest/v1",
+                schema=schema_name,
+                headers={"Accept": "application/json", "Content-Type": "application/json", **self._headers},
+                http_client=self._http,
+            )
+            self._schemas[schema_name] = client
+        return client
+
+    def table(self, table_name):
+        return self._rest().from_(table_name)
+
+    def from_(self, table_name):
+        return self.table(table_name)
+
+    def schema(self, schema_name):
+        return self._rest(schema_name)
+
+    def rpc(self, function_name, params=None):
+        return self._rest().rpc(function_name, params or {})
+
+
+class AsyncDataLayer:
+    """
+    Capa de acceso a datos async: cliente (Supabase o local) + descargas de
+    imágenes, con pool de conexiones HTTP/2, cupo por endpoint y reintentos.
+
+    Corre su propio event loop en un hilo, así el código sincrónico (y los
+    hilos por tienda) pueden lanzar muchas corrutinas con `run()` / `gather()`.
+    """
+
+    def __init__(self, sync_client=None, stats=None, limiter=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 per_endpoint=DEFAULT_PER_ENDPOINT, retries=DEFAULT_RETRIES, limits=None,
+                 url=None, key=None):
+        """
+        sync_client: cliente sincrónico (create_backend) a reutilizar con
+        SUPABASE_BACKEND=local; sus llamadas corren en hilos (to_thread) y ya
+        pasan por su propio limitador y estadísticas.
+        limiter: RateLimiter global para las llamadas HTTP a Supabase.
+        """
+        kind = os.environ.get("SUPABASE_BACKEND", "supabase").strip().lower()
+        if kind not in ("supabase", "local"):
+            raise ValueError(f"❌ SUPABASE_BACKEND desconocido: {kind!r} (usar 'supabase' o 'local')")
+        if kind == "supabase":
+            url = url or os.environ.get("SUPABASE_URL")
+            key = key or os.environ.get("SUPABASE_KEY")
+            if not url or not key:
+                raise ValueError("❌ Faltan credenciales SUPABASE_URL o SUPABASE_KEY en .env")
+        elif sync_client is None:
+            raise ValueError("❌ El backend local necesita el cliente sincrónico (sync_client)")
+
+        self.stats = stats
+        self.pool = _EndpointPool(per_endpoint, retries, stats, limits, limiter if kind == "supabase" else None)
+        # Las imágenes vienen de CDNs de las tiendas: no gastan el cupo de
+        # requests/s de Supabase, solo el semáforo por host
+        self.image_pool = _EndpointPool(per_endpoint, retries, stats, limits)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-data-layer", daemon=True)
+        self._thread.start()
+
+        http_limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        timeout = httpx.Timeout(30.0, connect=10.0)
+
+        async def make_client():
+            return httpx.AsyncClient(http2=True, limits=http_limits, timeout=timeout, follow_redirects=True)
+
+        # Un pool para la API (PostgREST + Storage) y otro para las tiendas (imágenes)
+        self._images = self.run(make_client())
+        self._api = None
+        if kind == "local":
+            self.client = AsyncClient(sync_client, self.pool, blocking=True)
+        else:
+            self._api = self.run(make_client())
+            self.client = AsyncClient(_AsyncSupabaseTarget(url, key, self._api), self.pool)
+
+    # --- Puente sync -> async ---
+    def run(self, coro):
+        """Ejecuta una corrutina en el loop de la capa y espera su resultado."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def gather(self, coros, return_exceptions=False):
+        """Corre muchas corrutinas a la vez (el cupo real lo ponen los semáforos)."""
+        async def gather_all():
+            return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+        return self.run(gather_all())
+
+    # --- Imágenes ---
+    async def fetch(self, url):
+        """Descarga `url` con el pool de imágenes (cupo por host, reintentos). Retorna bytes."""
+        host = urlsplit(url).netloc or "?"
+
+        async def get():
+            response = await self._images.get(url)
+            response.raise_for_status()
+            return response.content
+
+        return await self.image_pool.call(f"img:{host}", "get", f"img:{host}", get)
+
+    def close(self):
+        async def close_all():
+            await self._images.aclose()
+            if self._api is not None:
+                await self._api.aclose()
+        try:
+            self.run(close_all())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
@@ -0,0 +1,319 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+from name_matcher import brand_candidates, normalize_brand, normalize_text
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+EMBEDDINGS_DIR = BASE_DIR / "Cache" / "Embeddings"
+
+# Vecinos revisados por consulta (el primero que pase el gating de marca gana)
+TOP_K = 5
+
+# Consultas por multiplicación de matrices en la búsqueda por fuerza bruta
+QUERY_BLOCK = 1024
+
+
+# ================= EMBEDDERS =================
+
+class OllamaEmbedder:
+    """Embeddings con el runtime local de ollama (p.ej. `ollama pull nomic-embed-text`)."""
+
+    def __init__(self, model="nomic-embed-text", batch_size=64):
+        import ollama
+        self._ollama = ollama
+        self.model = model
+        self.batch_size = batch_size
+
+    @property
+    def name(self):
+        return f"ollama-{self.model}"
+
+    def embed(self, texts):
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            response = self._ollama.embed(model=self.model, input=texts[i:i + self.batch_size])
+            vectors.extend(response["embeddings"])
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+
+class HashingEmbedder:
+    """
+    Embedder determinista sin modelo (n-gramas de caracteres con hashing).
+    Sirve para pruebas y benchmarks cuando ollama no está disponible.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    @property
+    def name(self):
+        return f"hashing-{self.dim}"
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f" {normalize_text(text)} "
+            for i in range(len(padded) - 2):
+                digest = hashlib.blake2b(padded[i:i + 3].encode(), digest_size=4).digest()
+                matrix[row, int.from_bytes(digest, "little") % self.dim] += 1.0
+        return matrix
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# ================= CACHE DE EMBEDDINGS DE SPECS =================
+
+class SpecEmbeddingStore:
+    """
+    Embeddings de MetaName por tabla, persistidos en disco
+    (Cache/Embeddings/<embedder>/<tabla>.npz). Solo se recalculan las specs
+    nuevas o cuyo nombre cambió (hash del texto embebido).
+    """
+
+    def __init__(self, embedder, cache_dir=EMBEDDINGS_DIR):
+        self.embedder = embedder
+        self.cache_dir = Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]", "_", embedder.name)
+
+    @staticmethod
+    def spec_text(row):
+        return str(row.get("MetaName") or "")
+
+    def sync(self, table_name, rows):
+        """Retorna (ids, matriz normalizada) al día con `rows`."""
+        path = self.cache_dir / f"{table_name}.npz"
+        cached = {}
+        if path.exists():
+            stored = np.load(path, allow_pickle=False)
+            for spec_id, text_hash, vector in zip(stored["ids"], stored["hashes"], stored["vectors"]):
+                cached[str(spec_id)] = (str(text_hash), vector)
+
+        ids, hashes, vectors = [], [], []
+        to_embed = []
+        for row in rows:
+            text = self.spec_text(row)
+            if not text:
+                continue
+            spec_id = str(row["Id"])
+            text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            ids.append(spec_id)
+            hashes.append(text_hash)
+            previous = cached.get(spec_id)
+            if previous is not None and previous[0] == text_hash:
+                vectors.append(previous[1])
+            else:
+                vectors.append(None)
+                to_embed.append((len(vectors) - 1, text))
+
+        if to_embed:
+            print(f"   🧠 {table_name}: calculando {len(to_embed)} embeddings nuevos/cambiados...")
+            fresh = normalize_rows(self.embedder.embed([text for _, text in to_embed]))
+            for (position, _), vector in zip(to_embed, fresh):
+                vectors[position] = vector
+
+        matrix = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, 1), dtype=np.float32)
+        if to_embed or len(ids) != len(cached):
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp.npz")
+            np.savez(tmp_path, ids=np.array(ids), hashes=np.array(hashes), vectors=matrix)
+            os.replace(tmp_path, path)
+        return ids, matrix
+
+
+# ================= ÍNDICE VECTORIAL =================
+
+class VectorIndex:
+    """
+    Búsqueda de vecinos más cercanos (coseno) sobre una matriz NumPy.
+    Con `nlist` > 0 usa particiones IVF (k-means): cada consulta solo se
+    compara con las specs de las `nprobe` particiones más cercanas.
+    """
+
+    def __init__(self, matrix, nlist=0, nprobe=4, seed=0):
+        self.matrix = matrix
+        self.nlist = min(nlist, len(matrix)) if nlist else 0
+        self.nprobe = max(1, nprobe)
+        if self.nlist:
+            self._train(seed)
+
+    def _train(self, seed, iterations=10):
+        rng = np.random.default_rng(seed)
+        centroids = self.matrix[rng.choice(len(self.matrix), self.nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, self.matrix)
+            counts = np.bincount(assignment, minlength=self.nlist)
+            empty = counts == 0
+            sums[~empty] /= counts[~empty, None]
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+        self.centroids = centroids
+        assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+        self.lists = [np.flatnonzero(assignment == c) for c in range(self.nlist)]
+
+    def search(self, queries, k=TOP_K):
+        """Retorna (índices, scores) de forma (n_consultas, k); -1 si no hay vecino."""
+        k = max(1, min(k, len(self.matrix)))
+        indexes = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if not len(self.matrix) or not len(queries):
+            return indexes, scores
+
+        if not self.nlist:
+            # Fuerza bruta en bloques de consultas para acotar la memoria
+            for start in range(0, len(queries), QUERY_BLOCK):
+                similarity = queries[start:start + QUERY_BLOCK] @ self.matrix.T
+                top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(similarity, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                indexes[start:start + QUERY_BLOCK] = np.take_along_axis(top, order, axis=1)
+                scores[start:start + QUERY_BLOCK] = np.take_along_axis(top_scores, order, axis=1)
+            return indexes, scores
+
+        # IVF: consultas agrupadas por partición sondeada, una multiplicación por partición
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.nprobe]
+        for cluster in range(self.nlist):
+            members = self.lists[cluster]
+            query_rows = np.flatnonzero((probes == cluster).any(axis=1))
+            if not len(members) or not len(query_rows):
+                continue
+            similarity = queries[query_rows] @ self.matrix[members].T
+            merged_idx = np.concatenate([indexes[query_rows], np.broadcast_to(members, similarity.shape)], axis=1)
+            merged_scores = np.concatenate([scores[query_rows], similarity], axis=1)
+            order = np.argsort(-merged_scores, axis=1)[:, :k]
+            indexes[query_rows] = np.take_along_axis(merged_idx, order, axis=1)
+            scores[query_rows] = np.take_along_axis(merged_scores, order, axis=1)
+        return indexes, scores
+
+
+# ================= MATCHER =================
+
+class EmbeddingMatcher:
+    """
+    Matcher por embeddings: misma interfaz que NameMatcher.match.
+    `load_rows(table_name)` debe retornar filas (Id, MetaName, MetaManufacturer).
+    """
+
+    def __init__(self, embedder, load_rows, min_score=0.85, use_ivf=False, nprobe=4, cache_dir=EMBEDDINGS_DIR):
+        self.embedder = embedder
+        self.load_rows = load_rows
+        self.min_score = min_score
+        self.use_ivf = use_ivf
+        self.nprobe = nprobe
+        self.store = SpecEmbeddingStore(embedder, cache_dir)
+        self.tables = {}
+
+    def table_index(self, table_name):
+        if table_name not in self.tables:
+            rows = self.load_rows(table_name)
+            brands = {}
+            for row in rows:
+                brand = normalize_brand(row.get("MetaManufacturer"))
+                if not brand:
+                    name = normalize_text(row.get("MetaName"))
+                    brand = name.split(" ")[0] if name else ""
+                brands[str(row["Id"])] = brand
+            ids, matrix = self.store.sync(table_name, rows)
+            nlist = int(np.sqrt(len(ids))) if self.use_ivf and len(ids) > 1000 else 0
+            self.tables[table_name] = (ids, [brands[i] for i in ids], VectorIndex(matrix, nlist, self.nprobe))
+        return self.tables[table_name]
+
+    def match(self, items):
+        """
+        items: lista de (tablas_objetivo, scraped_name, scraped_brand).
+        Retorna [(spec_id, tabla, score) | None] alineado con `items`.
+        """
+        best = [None] * len(items)
+        valid = [(i, name) for i, (_, name, _) in enumerate(items) if normalize_text(name)]
+        if not valid:
+            return best
+        query_vectors = normalize_rows(self.embedder.embed([name for _, name in valid]))
+        row_of_item = {item_index: row for row, (item_index, _) in enumerate(valid)}
+
+        by_table = {}
+        for item_index, _ in valid:
+            tables, _, _ = items[item_index]
+            for table_name in ([tables] if isinstance(tables, str) else tables):
+                by_table.setdefault(table_name, []).append(item_index)
+
+        for table_name, item_indexes in by_table.items():
+            ids, spec_brands, index = self.table_index(table_name)
+            rows = [row_of_item[i] for i in item_indexes]
+            neighbor_idx, neighbor_scores = index.search(query_vectors[rows], TOP_K)
+            for item_index, candidates, scores in zip(item_indexes, neighbor_idx, neighbor_scores):
+                _, name, brand = items[item_index]
+                brand = normalize_brand(brand)
+                allowed = {brand} if brand else brand_candidates(normalize_text(name))
+                for spec_index, score in zip(candidates, scores):
+                    if spec_index < 0 or score < self.min_score:
+                        break
+                    if spec_brands[spec_index] in allowed:
+                        if best[item_index] is None or score > best[item_index][2]:
+                            best[item_index] = (ids[spec_index], table_name, float(score))
+                        break
+        return best
+
+
+# ================= BENCHMARK =================
+
+def _load_store_rows(path):
+    """Filas de una categoría empaquetada de SpecDB/SpecStore (si una key se repite gana la última)."""
+    records = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record["key"]] = record["data"]
+    return [
+        {"Id": key, "MetaName": data.get("name"), "MetaManufacturer": data.get("Manufacturer")}
+        for key, data in sorted(records.items())
+    ]
+
+
+def benchmark(path, n_queries, model=None, use_ivf=False, cache_dir=None):
+    embedder = OllamaEmbedder(model) if model else HashingEmbedder()
+    rows = _load_store_rows(path)
+    rng = np.random.default_rng(0)
+    sample = [rows[i] for i in rng.choice(len(rows), min(n_queries, len(rows)), replace=False)]
+    items = [("Bench", f"{row['MetaName']} Chile", "N/A") for row in sample]
+
+    matcher = EmbeddingMatcher(
+        embedder, lambda _: rows, min_score=0.0, use_ivf=use_ivf,
+        cache_dir=cache_dir or EMBEDDINGS_DIR / "_bench",
+    )
+    started = time.perf_counter()
+    matcher.table_index("Bench")
+    index_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = matcher.match(items)
+    match_seconds = time.perf_counter() - started
+
+    correct = sum(1 for row, result in zip(sample, results) if result and result[0] == row["Id"])
+    print(f"📊 Embedder: {embedder.name} | IVF: {'sí' if use_ivf else 'no'}")
+    print(f"   Specs: {len(rows)} (índice en {index_seconds:.2f}s)")
+    print(f"   Consultas: {len(items)} en {match_seconds:.2f}s -> {len(items) / match_seconds:.1f} items/s")
+    print(f"   Top-1 correcto: {correct}/{len(items)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del matcher por embeddings.")
+    parser.add_argument("--specs", default=str(BASE_DIR.parent / "SpecDB" / "SpecStore" / "Memory.jsonl.gz"))
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--model", help="Modelo de ollama (sin esto se usa el embedder de hashing)")
+    parser.add_argument("--ivf", action="store_true")
+    args = parser.parse_args()
+    benchmark(args.specs, args.queries, model=args.model, use_ivf=args.ivf)
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+IMAGE_CACHE_DIR = Path(os.environ.get("IMAGE_CACHE_DIR", BASE_DIR / "Cache" / "Images"))
+IMAGE_CACHE_MAX_MB = int(os.environ.get("IMAGE_CACHE_MAX_MB", "512"))
+
+
+class ImageCache:
+    """
+    Cache local direccionado por contenido para imágenes ya convertidas a WebP.
+
+    - urls:  URL de origen -> hash (sha256) de los bytes descargados
+    - blobs: hash -> archivo WebP convertido, con tamaño y último acceso (LRU)
+
+    Dos tiendas que sirven la misma imagen (mismos bytes) comparten el mismo
+    WebP aunque las URLs sean distintas.
+    """
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.blobs_dir = self.cache_dir / "blobs"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_dir / "index.sqlite", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, content_hash TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "content_hash TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_access ON blobs(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(raw_bytes):
+        return hashlib.sha256(raw_bytes).hexdigest()
+
+    def _blob_path(self, content_hash):
+        return self.blobs_dir / f"{content_hash}.webp"
+
+    def _read_blob(self, content_hash):
+        """Lee el WebP y actualiza su último acceso. Retorna None si no existe."""
+        path = self._blob_path(content_hash)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            # Índice desincronizado (archivo borrado a mano): limpiar entrada
+            self._conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+            return None
+        self._conn.execute(
+            "UPDATE blobs SET last_access = ? WHERE content_hash = ?", (time.time(), content_hash)
+        )
+        self._conn.commit()
+        return data
+
+    def get_by_url(self, url):
+        """WebP asociado a una URL de origen ya vista, sin tocar la red."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                return None
+            return self._read_blob(row[0])
+
+    def get_by_hash(self, content_hash, url=None):
+        """
+        WebP asociado a unos bytes de origen ya convertidos (deduplicación entre tiendas).
+        Si se entrega `url`, queda asociada al hash para la próxima vez.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if not row:
+                return None
+            data = self._read_blob(content_hash)
+            if data is not None and url:
+                self._link_url(url, content_hash)
+            return data
+
+    def put(self, url, content_hash, webp_bytes):
+        """Guarda el WebP convertido y lo asocia a la URL de origen."""
+        with self._lock:
+            path = self._blob_path(content_hash)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(webp_bytes)
+            os.replace(tmp_path, path)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (content_hash, size, last_access) VALUES (?, ?, ?)",
+                (content_hash, len(webp_bytes), time.time()),
+            )
+            self._link_url(url, content_hash)
+            self._evict()
+
+    def _link_url(self, url, content_hash):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO urls (url, content_hash) VALUES (?, ?)", (url, content_hash)
+        )
+        self._conn.commit()
+
+    def _evict(self):
+        """Elimina los blobs menos usados recientemente hasta quedar bajo el límite."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT content_hash, size FROM blobs ORDER BY last_access ASC"
+        ).fetchall()
+        for content_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                self._blob_path(content_hash).unlink()
+            except OSError:
+                pass
+            self._conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            self._conn.execute("DELETE FROM urls WHERE content_hash = ?", (content_hash,))
+            total -= size
+        self._conn.commit()
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+MATCH_CACHE_FILE = BASE_DIR / "Cache" / "match_cache.json"
+
+
+def match_key(raw_type, part_number):
+    """Clave normalizada (tipo, part #): sin espacios repetidos y en mayúsculas."""
+    return f"{raw_type}|{' '.join(str(part_number).split()).upper()}"
+
+
+def name_match_key(raw_type, scraped_name, scraped_brand):
+    """Clave del matcher por nombre (tipo, marca, nombre normalizados)."""
+    name = " ".join(str(scraped_name or "").split()).lower()
+    brand = " ".join(str(scraped_brand or "").split()).lower()
+    return f"name|{raw_type}|{brand}|{name}"
+
+
+class MatchCache:
+    """
+    Cache persistente entre ejecuciones: (tipo, part #) -> (spec_id, tabla).
+    También guarda los resultados del matcher por nombre (name_match_key).
+
+    Guarda también los resultados negativos (sin match) con un TTL, para no
+    repetir la búsqueda todos los días. Todo el cache se descarta cuando cambia
+    el marcador de versión de la base de specs (ver spec_version.py).
+    """
+
+    def __init__(self, path=MATCH_CACHE_FILE, negative_ttl_hours=72):
+        self.path = Path(path)
+        self.negative_ttl = negative_ttl_hours * 3600
+        self.version = None
+        self.name_rules = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def load(self, spec_version, name_rules=None):
+        """
+        name_rules identifica los criterios del matcher por nombre (umbral,
+        gating): si cambiaron, se descartan solo las entradas name|...
+        """
+        self.version = spec_version
+        self.name_rules = name_rules
+        self.entries = {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stored.get("spec_version") != spec_version:
+            print("   ♻️  Versión de specs cambió: se descarta el cache de matches.")
+            return
+        self.entries = stored.get("entries", {})
+        if stored.get("name_rules") != name_rules:
+            dropped = [key for key in self.entries if key.startswith("name|")]
+            for key in dropped:
+                del self.entries[key]
+            if dropped:
+                print(f"   ♻️  Criterios del matcher por nombre cambiaron: {len(dropped)} entradas descartadas.")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            payload = {"spec_version": self.version, "name_rules": self.name_rules, "entries": self.entries}
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """Retorna (encontrado_en_cache, spec_id, tabla)."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["spec_id"] is None:
+                if time.time() - entry["ts"] > self.negative_ttl:
+                    del self.entries[key]
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None, None
+            self.hits += 1
+            return True, entry["spec_id"], entry["table"]
+
+    def put(self, key, spec_id, table_name):
+        with self._lock:
+            self.entries[key] = {"spec_id": spec_id, "table": table_name, "ts": time.time()}
@@ -1,25 +1,124 @@
 import os
+import argparse
+import asyncio
+import math
 import json
 import re
 import requests
 import uuid as uuid_lib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from datetime import datetime
+from datetime import date, datetime
 from pathlib import Path
 from dotenv import load_dotenv
-from supabase import create_client
 from PIL import Image
+from image_cache import ImageCache
+from match_cache import MatchCache, match_key, name_match_key
+from name_matcher import NameMatcher
+from outputs_loader import iter_store_batches
+from part_numbers import PART_NUMBERS_COLUMN, normalize_part_number, split_part_numbers
+from price_cache import LastPriceCache, price_key
+from price_outliers import OUTLIER_REPORT_FILE, PriceObservations, find_outliers, write_report
+from rate_limit import RateLimiter
+from snapshot_diff import SnapshotStore, diff_rows, normalize_items
+from spec_version import read_spec_version
+from storage_backend import RequestStats, create_backend
+from async_backend import AsyncDataLayer, is_retryable
+from store_snapshot import SNAPSHOT_FUNCTION, SNAPSHOT_SQL_FILE, register_local_snapshot_rpc, snapshot_params
 
 # ================= CONFIGURACIÓN =================
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(dotenv_path=BASE_DIR / ".env")
-supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+
+# Tiendas procesadas en paralelo (1 = secuencial) y límite global de requests
+# por segundo hacia Supabase compartido por todos los hilos (0 = sin límite)
+STORE_WORKERS = int(os.environ.get("MATCH_STORE_WORKERS", "1"))
+SUPABASE_MAX_RPS = float(os.environ.get("SUPABASE_MAX_RPS", "0"))
+
+# Hilos para resolver part numbers (etapa previa, común a todas las tiendas)
+RESOLVE_WORKERS = int(os.environ.get("MATCH_RESOLVE_WORKERS", "8"))
+
+# Cliente de datos: Supabase real o sustituto local (SUPABASE_BACKEND=local),
+# siempre con contador de round trips y latencia
+supabase_limiter = RateLimiter(SUPABASE_MAX_RPS)
+backend_stats = RequestStats()
+supabase = create_backend(limiter=supabase_limiter, stats=backend_stats)
+
+# Fases B y C de cada tienda en un solo RPC transaccional (apply_store_snapshot).
+# En Supabase requiere instalar sql/apply_store_snapshot.sql; en local se
+# registra el sustituto SQLite.
+SNAPSHOT_RPC_ENABLED = os.environ.get("MATCH_SNAPSHOT_RPC", "0").strip().lower() not in ("0", "false", "no", "off")
+register_local_snapshot_rpc(supabase)
+
+# Capa async (HTTP/2 con keep-alive, cupo por endpoint y reintentos con jitter)
+# para lookups, upserts, stock agotado e imágenes. Con el backend local las
+# llamadas corren en hilos sobre el mismo cliente.
+ASYNC_IO_ENABLED = os.environ.get("MATCH_ASYNC_IO", "0").strip().lower() not in ("0", "false", "no", "off")
+async_io = AsyncDataLayer(
+    supabase,
+    stats=backend_stats,
+    limiter=supabase_limiter,
+    max_connections=int(os.environ.get("ASYNC_MAX_CONNECTIONS", "32")),
+    per_endpoint=int(os.environ.get("ASYNC_PER_ENDPOINT", "8")),
+    retries=int(os.environ.get("ASYNC_RETRIES", "4")),
+) if ASYNC_IO_ENABLED else None
 
 # Schemas
 SPECIFICATIONS_SCHEMA = "specifications"
 
 SCRAP_OUTPUT_DIR = BASE_DIR / "Outputs"
 LOG_FILE = BASE_DIR / "unmatched_log.txt"
+# Items sin match en formato estructurado (JSONL), para --unmatched-only
+UNMATCHED_FILE = BASE_DIR / "Cache" / "unmatched_items.jsonl"
+UNMATCHED_FIELDS = ("store_name", "type", "part #", "price", "url", "scraped_name", "scraped_brand", "image_url", "_source_file")
+
+# Procesos para parsear los JSON de Outputs
+LOADER_WORKERS = int(os.environ.get("MATCH_LOADER_WORKERS", os.cpu_count() or 1))
+
+# Tamaño de página para lecturas masivas (límite por defecto de PostgREST)
+PAGE_SIZE = 1000
+
+# PriceHistory solo se escribe si cambia el precio o el producto vuelve a
+# stock. Con un valor > 0 se escribe además una fila cada N días aunque el
+# precio no cambie (1 = heartbeat diario).
+PRICE_HISTORY_HEARTBEAT_DAYS = int(os.environ.get("PRICE_HISTORY_HEARTBEAT_DAYS", "0"))
+
+# Horas que se recuerda un "sin match" antes de volver a buscarlo
+MATCH_CACHE_NEGATIVE_TTL_HOURS = float(os.environ.get("MATCH_CACHE_NEGATIVE_TTL_HOURS", "72"))
+
+# Corrida incremental: se compara cada tienda con su snapshot anterior y solo
+# se resuelve/escribe lo agregado o cambiado. Cada MATCH_FULL_REFRESH_DAYS días
+# (o si cambió la versión de specs) la tienda se procesa completa.
+INCREMENTAL_ENABLED = os.environ.get("MATCH_INCREMENTAL", "1").strip().lower() not in ("0", "false", "no", "off")
+FULL_REFRESH_DAYS = int(os.environ.get("MATCH_FULL_REFRESH_DAYS", "7"))
+
+# Precios atípicos entre tiendas (mediana/MAD por spec): se dejan en cuarentena
+# en Cache/price_outliers.jsonl en vez de escribirlos
+PRICE_OUTLIER_ENABLED = os.environ.get("PRICE_OUTLIER_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+PRICE_OUTLIER_MAX_Z = float(os.environ.get("PRICE_OUTLIER_MAX_Z", "3.5"))
+PRICE_OUTLIER_MIN_RATIO = float(os.environ.get("PRICE_OUTLIER_MIN_RATIO", "2.0"))
+PRICE_OUTLIER_MIN_STORES = int(os.environ.get("PRICE_OUTLIER_MIN_STORES", "3"))
+
+# Matcher de respaldo por nombre para items sin part # o cuyo part # no calzó.
+# Apagado por defecto: sus matches van directo a ProductPricing sin revisión.
+# Cada match aceptado queda en NAME_MATCH_AUDIT_FILE para auditarlo.
+NAME_MATCH_ENABLED = os.environ.get("NAME_MATCH_ENABLED", "0").strip().lower() not in ("0", "false", "no", "off")
+NAME_MATCH_MIN_SCORE = float(os.environ.get("NAME_MATCH_MIN_SCORE", "0.85"))
+NAME_MATCH_AUDIT_FILE = BASE_DIR / "RunLogs" / "name_matches.jsonl"
+
+# Etapa opcional por embeddings (ollama local) para lo que el matcher por nombre no resolvió
+EMBED_MATCH_ENABLED = os.environ.get("EMBED_MATCH_ENABLED", "0").strip().lower() not in ("0", "false", "no", "off")
+EMBED_MATCH_MODEL = os.environ.get("EMBED_MATCH_MODEL", "nomic-embed-text")
+EMBED_MATCH_MIN_SCORE = float(os.environ.get("EMBED_MATCH_MIN_SCORE", "0.85"))
+EMBED_MATCH_IVF = os.environ.get("EMBED_MATCH_IVF", "0").strip().lower() not in ("0", "false", "no", "off")
+
+# Criterios con los que se cachearon los matches por nombre: si cambian, esas
+# entradas del cache de matches se descartan (ver MatchCache.load)
+NAME_MATCH_RULES = f"brand-strict|name>={NAME_MATCH_MIN_SCORE}|embed>={EMBED_MATCH_MIN_SCORE}"
+
+# Valores de "part #" que los scrapers usan cuando no encontraron el dato
+MISSING_PART_NUMBERS = {"", "N/A", "NA", "-", "ERROR", "NONE", "NULL"}
 
 # Mapeo de categorías a tablas
 CATEGORY_TO_TABLE = {
@@ -58,22 +157,113 @@ CATEGORY_TO_TABLE = {
 }
 
 
+# IDs de specs que ya tienen ImageUrl, por tabla. Se precarga al inicio del
+# proceso y se mantiene al día a medida que se suben imágenes.
+SPECS_WITH_IMAGE = {}
+
+# Cache local de imágenes WebP (por URL de origen y hash de contenido)
+image_cache = ImageCache()
+
+# Último precio conocido por (SpecId, SpecTableName, StoreId)
+price_cache = LastPriceCache(heartbeat_days=PRICE_HISTORY_HEARTBEAT_DAYS)
+
+# Matches persistentes (tipo, part #) -> (spec_id, tabla) entre ejecuciones
+match_cache = MatchCache(negative_ttl_hours=MATCH_CACHE_NEGATIVE_TTL_HOURS)
+
+# Snapshots por tienda de la última corrida (para el modo incremental)
+snapshot_store = SnapshotStore()
+
+# URLs con precio en cuarentena en esta corrida (ver detect_price_outliers)
+QUARANTINED_URLS = set()
+
+# Estado de la corrida actual (lo fija process_daily_scraps)
+RUN_OPTIONS = {"spec_version": None, "incremental": INCREMENTAL_ENABLED}
+
+
 # ================= FUNCIONES =================
 
+def get_spec_tables():
+    """Retorna todas las tablas de especificaciones referenciadas en CATEGORY_TO_TABLE."""
+    tables = set()
+    for value in CATEGORY_TO_TABLE.values():
+        if isinstance(value, str): tables.add(value)
+        else: tables.update(value)
+    return sorted(tables)
+
+def load_specs_with_image(table_name):
+    """
+    Carga (paginado) el set de Ids de una tabla de especificaciones que ya tienen ImageUrl.
+    """
+    ids = set()
+    start = 0
+    while True:
+        res = supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+            .select("Id")\
+            .not_.is_("ImageUrl", "null")\
+            .range(start, start + PAGE_SIZE - 1)\
+            .execute()
+        rows = res.data or []
+        ids.update(row["Id"] for row in rows)
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return ids
+
+def prefetch_image_status():
+    """Una consulta paginada por tabla en vez de un SELECT por producto."""
+    print("   🖼️  Precargando estado de imágenes...")
+    for table_name in get_spec_tables():
+        try:
+            SPECS_WITH_IMAGE[table_name] = load_specs_with_image(table_name)
+        except Exception as e:
+            print(f"   ⚠️  No se pudo precargar imágenes de {table_name}: {e}")
+    total = sum(len(ids) for ids in SPECS_WITH_IMAGE.values())
+    print(f"   🖼️  {total} specs ya tienen imagen.")
+
+def bootstrap_last_prices():
+    """Arma el cache de últimos precios desde ProductPricing (solo la primera vez)."""
+    print("   💲 Inicializando cache de últimos precios desde la DB...")
+    entries = {}
+    start = 0
+    while True:
+        res = supabase.table("ProductPricing")\
+            .select("SpecId, SpecTableName, StoreId, Price, StockStatus")\
+            .range(start, start + PAGE_SIZE - 1)\
+            .execute()
+        rows = res.data or []
+        for row in rows:
+            key = price_key(row["SpecId"], row["SpecTableName"], row["StoreId"])
+            entries[key] = {
+                "price": row.get("Price"),
+                "in_stock": bool(row.get("StockStatus")),
+                "recorded": None,
+            }
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return entries
+
+def has_part_number(part_num):
+    return bool(part_num) and str(part_num).strip().upper() not in MISSING_PART_NUMBERS
+
+def load_spec_names(table_name):
+    """Filas (Id, MetaName, MetaManufacturer) de una tabla de specs, paginadas."""
+    rows = []
+    start = 0
+    while True:
+        res = supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+            .select("Id, MetaName, MetaManufacturer")\
+            .range(start, start + PAGE_SIZE - 1)\
+            .execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return rows
+
 def parse_part_numbers(raw_val):
-    if not raw_val: return []
-    if isinstance(raw_val, list):
-        return [str(v).strip() for v in raw_val if v]
-    s = str(raw_val).strip()
-    if s.startswith("[") and s.endswith("]"):
-        content = s[1:-1]
-        parts = []
-        for p in content.split(','):
-            clean_p = p.strip().strip("'").strip('"')
-            if clean_p:
-                parts.append(clean_p)
-        return parts
-    return [s]
+    return split_part_numbers(raw_val)
 
 def get_or_create_store(store_name):
     res = supabase.table("Stores").select("Id").eq("Name", store_name).execute()
@@ -83,58 +273,136 @@ def get_or_create_store(store_name):
         res = supabase.table("Stores").insert({"Name": store_name}).execute()
         return res.data[0]['Id']
 
-def find_spec_id(tables, part_number):
+# Tablas sin la columna de part numbers (migración sql/part_numbers_array.sql sin
+# aplicar): se buscan solo con ilike sobre "MetaPartNumber"
+TABLES_WITHOUT_PART_ARRAY = set()
+
+# Errores de columna inexistente: Postgres (undefined_column) y el cache de esquema de PostgREST
+UNDEFINED_COLUMN_CODES = ("42703", "PGRST204")
+
+def spec_exact_query(client, table_name, candidates):
+    """Match exacto contra el arreglo de part numbers (índice GIN), todos los candidatos en un request."""
+    return client.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+        .select("Id")\
+        .overlaps(PART_NUMBERS_COLUMN, [normalize_part_number(c) for c in candidates])\
+        .limit(1)
+
+def spec_lookup_query(client, table_name, candidate):
+    """Query de búsqueda por part # (la misma para el cliente sync y el async)."""
+    return client.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+        .select("Id")\
+        .ilike("MetaPartNumber", f"%{candidate}%")\
+        .limit(1)
+
+def is_undefined_column(error):
+    if str(getattr(error, "code", "")) in UNDEFINED_COLUMN_CODES:
+        return True
+    # Backend local (SQLite)
+    return "no such column" in str(error)
+
+def exact_lookup_failed(table_name, error, errors):
+    """
+    Solo un error de columna inexistente marca la tabla como sin arreglo de part
+    numbers. Cualquier otro error queda en `errors`: el "sin match" no se cachea
+    y la lookup exacta se vuelve a intentar en el próximo item.
+    """
+    if is_undefined_column(error):
+        print(f"⚠️ {table_name}: sin columna {PART_NUMBERS_COLUMN}, se usa solo ilike ({error})")
+        TABLES_WITHOUT_PART_ARRAY.add(table_name)
+    elif errors is not None:
+        errors.append(error)
+
+def find_spec_id(tables, part_number, errors=None):
     if isinstance(tables, str): target_tables = [tables]
     else: target_tables = tables
     candidates = parse_part_numbers(part_number)
     if not candidates: return None, None
 
+    # 1. Exacto en todas las tablas; 2. substring (part numbers con sufijos de región, etc.)
+    for table_name in target_tables:
+        if table_name in TABLES_WITHOUT_PART_ARRAY:
+            continue
+        try:
+            res = spec_exact_query(supabase, table_name, candidates).execute()
+            if res.data:
+                return res.data[0]['Id'], table_name
+        except Exception as e:
+            exact_lookup_failed(table_name, e, errors)
+
     for table_name in target_tables:
         for candidate in candidates:
             try:
-                res = supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
-                    .select("Id")\
-                    .ilike("MetaPartNumber", f"%{candidate}%")\
-                    .limit(1)\
-                    .execute()
+                res = spec_lookup_query(supabase, table_name, candidate).execute()
                 if res.data:
                     return res.data[0]['Id'], table_name
             except Exception as e:
+                if errors is not None: errors.append(e)
                 continue
     return None, None
 
+def resolve_spec(raw_type, target_tables, part_number):
+    """find_spec_id con el cache persistente de matches por delante."""
+    key = match_key(raw_type, part_number)
+    cached, spec_id, found_table = match_cache.get(key)
+    if cached:
+        return spec_id, found_table
+    errors = []
+    spec_id, found_table = find_spec_id(target_tables, part_number, errors)
+    # Un "sin match" causado por errores de red no se cachea
+    if spec_id or not errors:
+        match_cache.put(key, spec_id, found_table)
+    return spec_id, found_table
+
 def download_and_convert_image(image_url):
     """
     Descarga una imagen desde una URL y la convierte a formato WebP.
+    Consulta primero el cache local (por URL y luego por hash de contenido)
+    para evitar la descarga y/o la conversión con Pillow.
     Retorna: (bytes_webp, error_message)
     """
     try:
+        # Cache por URL: sin red ni Pillow
+        cached = image_cache.get_by_url(image_url)
+        if cached is not None:
+            return cached, None
+
         # Descargar imagen
         response = requests.get(image_url, timeout=10)
         response.raise_for_status()
-        
-        # Abrir imagen con Pillow
-        img = Image.open(BytesIO(response.content))
-        
-        # Convertir a RGB si es necesario (para PNGs con transparencia)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Convertir a WebP
-        output = BytesIO()
-        img.save(output, format='WEBP', quality=85, method=6)
-        output.seek(0)
-        
-        return output.read(), None
+
+        return convert_image_content(image_url, response.content), None
     except Exception as e:
         return None, str(e)
 
+def convert_image_content(image_url, content):
+    """Convierte los bytes descargados a WebP (o los toma del cache por contenido)."""
+    # Cache por contenido: misma imagen servida por otra tienda/URL
+    content_hash = image_cache.content_hash(content)
+    cached = image_cache.get_by_hash(content_hash, url=image_url)
+    if cached is not None:
+        return cached
+    # Abrir imagen con Pillow
+    img = Image.open(BytesIO(content))
+    
+    # Convertir a RGB si es necesario (para PNGs con transparencia)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Convertir a WebP
+    output = BytesIO()
+    img.save(output, format='WEBP', quality=85, method=6)
+    output.seek(0)
+    webp_bytes = output.read()
+
+    image_cache.put(image_url, content_hash, webp_bytes)
+    return webp_bytes
+
 def upload_to_supabase_storage(image_bytes, filename):
     """
     Sube una imagen a Supabase Storage en el bucket 'ProductsImages'.
@@ -160,25 +428,25 @@ def upload_to_supabase_storage(image_bytes, filename):
 def process_product_image(spec_id, table_name, image_url):
     """
     Procesa la imagen de un producto:
-    1. Verifica si ya tiene imagen en la tabla de especificaciones
+    1. Verifica (en memoria) si ya tiene imagen en la tabla de especificaciones
     2. Si no tiene, descarga, convierte a WebP y sube a Supabase
     3. Actualiza el campo ImageUrl en la tabla de especificaciones
     """
     try:
-        # Verificar si ya tiene imagen
-        existing = supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
-            .select("ImageUrl")\
-            .eq("Id", spec_id)\
-            .limit(1)\
-            .execute()
-        
-        if not existing.data:
-            return False
-        
-        current_image_url = existing.data[0].get('ImageUrl')
-        
-        # Si ya tiene imagen, no hacer nada
-        if current_image_url:
+        # Verificar si ya tiene imagen (set precargado en prefetch_image_status)
+        with_image = SPECS_WITH_IMAGE.get(table_name)
+        if with_image is None:
+            # La precarga falló para esta tabla: consultamos la fila directamente
+            existing = supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+                .select("ImageUrl")\
+                .eq("Id", spec_id)\
+                .limit(1)\
+                .execute()
+            if not existing.data:
+                return False
+            if existing.data[0].get('ImageUrl'):
+                return True
+        elif spec_id in with_image:
             return True
         
         # Descargar y convertir imagen
@@ -199,6 +467,8 @@ def process_product_image(spec_id, table_name, image_url):
         supabase.schema(SPECIFICATIONS_SCHEMA).from_(table_name).update({
             "ImageUrl": public_url
         }).eq("Id", spec_id).execute()
+        if with_image is not None:
+            with_image.add(spec_id)
         
         print(f"   ✅ Imagen procesada y subida para {spec_id}")
         return True
@@ -207,162 +477,812 @@ def process_product_image(spec_id, table_name, image_url):
         print(f"   ⚠️  Error procesando imagen: {e}")
         return False
 
-# ================= PROCESO PRINCIPAL =================
+# ================= VARIANTES ASYNC (MATCH_ASYNC_IO) =================
+# Mismas reglas que las funciones sincrónicas de arriba, pero con muchas
+# requests en vuelo a través de async_io (ver async_backend.py).
 
-def process_daily_scraps():
-    print("🚀 Iniciando procesamiento (Con Deduplicación y Precio Mínimo)...")
-    
-    with open(LOG_FILE, 'w', encoding='utf-8') as log:
-        log.write(f"--- Reporte de No Match: {datetime.now()} ---\n")
+async def find_spec_id_async(tables, part_number, errors=None):
+    target_tables = [tables] if isinstance(tables, str) else tables
+    candidates = parse_part_numbers(part_number)
+    if not candidates: return None, None
+    for table_name in target_tables:
+        if table_name in TABLES_WITHOUT_PART_ARRAY:
+            continue
+        try:
+            res = await spec_exact_query(async_io.client, table_name, candidates).execute()
+            if res.data:
+                return res.data[0]['Id'], table_name
+        except Exception as e:
+            exact_lookup_failed(table_name, e, errors)
+    for table_name in target_tables:
+        for candidate in candidates:
+            try:
+                res = await spec_lookup_query(async_io.client, table_name, candidate).execute()
+                if res.data:
+                    return res.data[0]['Id'], table_name
+            except Exception as e:
+                if errors is not None: errors.append(e)
+    return None, None
 
-    store_batches = {} 
+async def resolve_spec_async(raw_type, target_tables, part_number):
+    key = match_key(raw_type, part_number)
+    cached, spec_id, found_table = match_cache.get(key)
+    if cached:
+        return spec_id, found_table
+    errors = []
+    spec_id, found_table = await find_spec_id_async(target_tables, part_number, errors)
+    if spec_id or not errors:
+        match_cache.put(key, spec_id, found_table)
+    return spec_id, found_table
 
-    if not os.path.exists(SCRAP_OUTPUT_DIR):
-        print("❌ Directorio no encontrado.")
+async def process_product_image_async(spec_id, table_name, image_url):
+    try:
+        with_image = SPECS_WITH_IMAGE.get(table_name)
+        if with_image is None:
+            existing = await async_io.client.schema(SPECIFICATIONS_SCHEMA).from_(table_name)\
+                .select("ImageUrl")\
+                .eq("Id", spec_id)\
+                .limit(1)\
+                .execute()
+            if not existing.data:
+                return False
+            if existing.data[0].get('ImageUrl'):
+                return True
+        elif spec_id in with_image:
+            return True
+
+        webp_bytes = image_cache.get_by_url(image_url)
+        if webp_bytes is None:
+            content = await async_io.fetch(image_url)
+            # Pillow fuera del event loop
+            webp_bytes = await asyncio.to_thread(convert_image_content, image_url, content)
+
+        bucket = async_io.client.storage.from_("ProductsImages")
+        filename = f"{spec_id}.webp"
+        await bucket.upload(path=filename, file=webp_bytes, file_options={"content-type": "image/webp"})
+        public_url = await bucket.get_public_url(filename)
+
+        await async_io.client.schema(SPECIFICATIONS_SCHEMA).from_(table_name).update({
+            "ImageUrl": public_url
+        }).eq("Id", spec_id).execute()
+        if with_image is not None:
+            with_image.add(spec_id)
+
+        print(f"   ✅ Imagen procesada y subida para {spec_id}")
+        return True
+    except Exception as e:
+        print(f"   ⚠️  Error procesando imagen: {e}")
+        return False
+
+async def write_product_async(store_id, spec_id, data):
+    """Upsert + historial (si cambió) de un producto; el orden entre ambos se respeta."""
+    await async_io.client.table("ProductPricing").upsert(
+        pricing_row(spec_id, data, store_id), on_conflict="SpecId, SpecTableName, StoreId"
+    ).execute()
+    key = price_key(spec_id, data["table"], store_id)
+    record_history = price_cache.needs_history(key, data["price_int"])
+    if record_history:
+        await async_io.client.table("PriceHistory").insert(history_row(spec_id, data, store_id)).execute()
+    price_cache.update(key, data["price_int"], recorded=record_history)
+
+async def write_pricing_async(store_id, unique_products_today):
+    await asyncio.gather(*(
+        write_product_async(store_id, spec_id, data) for spec_id, data in unique_products_today.items()
+    ))
+    await asyncio.gather(*(
+        process_product_image_async(spec_id, data["table"], data["image_url"])
+        for spec_id, data in unique_products_today.items()
+        if data.get("image_url") and data["image_url"] != "N/A"
+    ))
+
+async def mark_out_of_stock_async(store_id, missing_ids):
+    now = datetime.now().isoformat()
+    await asyncio.gather(*(
+        async_io.client.table("ProductPricing").update({
+            "StockStatus": False,
+            "LastUpdated": now
+        }).eq("SpecId", missing).eq("StoreId", store_id).execute()
+        for missing in missing_ids
+    ))
+
+# ================= PROCESO PRINCIPAL =================
+
+def write_name_match_audit(records):
+    """Agrega los matches por nombre aceptados al log de auditoría (JSONL)."""
+    if not records:
         return
+    NAME_MATCH_AUDIT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(NAME_MATCH_AUDIT_FILE, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-    # 1. Lectura de Archivos
-    for root, dirs, files in os.walk(SCRAP_OUTPUT_DIR):
-        for filename in files:
-            if filename.endswith(".json"):
-                filepath = os.path.join(root, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = json.load(f)
-                        if isinstance(content, dict): content = [content]
-                        
-                        for item in content:
-                            s_name = item.get("store_name")
-                            if s_name:
-                                if s_name not in store_batches: store_batches[s_name] = []
-                                item["_source_file"] = filename
-                                store_batches[s_name].append(item)
-                except Exception as e:
-                    print(f"❌ Error en {filename}: {e}")
-
-    # 2. Procesamiento por Tienda
-    for store_name, items in store_batches.items():
-        print(f"\n🔵 Tienda: {store_name} - Items brutos: {len(items)}")
-        store_id = get_or_create_store(store_name)
-        
-        # --- FASE A: Deduplicación en Memoria ---
-        # Usaremos un diccionario donde la clave sea el SpecId (el producto único)
-        # y el valor sea el item con el MENOR precio encontrado.
-        unique_products_today = {} # { "UUID-XXX": {data_del_item_mas_barato} }
-        
-        # Lista para logs de error que escribiremos después
-        unmatched_buffer = []
+def resolve_by_name(candidates, stores=None):
+    """
+    Matcher de respaldo por nombre. candidates: { name_match_key: (tipo, nombre, marca) }.
+    Todos los nombres que no estén en el cache se puntúan en un solo lote por tabla.
+    stores: { name_match_key: {tiendas} }, solo para el log de auditoría.
+    """
+    results = {}
+    to_match = []
+    for key, (raw_type, name, brand) in candidates.items():
+        cached, spec_id, found_table = match_cache.get(key)
+        if cached:
+            results[key] = (spec_id, found_table)
+        else:
+            to_match.append((key, raw_type, name, brand))
+    if not to_match:
+        return results
+
+    queries = [(CATEGORY_TO_TABLE[raw_type], name, brand) for _, raw_type, name, brand in to_match]
+    matcher = NameMatcher(load_spec_names, min_score=NAME_MATCH_MIN_SCORE)
+    matches = matcher.match(queries)
+    methods = ["name"] * len(matches)
+
+    # Lo que quedó sin match pasa por embeddings (si está habilitado)
+    missing = [i for i, match in enumerate(matches) if match is None]
+    if EMBED_MATCH_ENABLED and missing:
+        from embedding_matcher import EmbeddingMatcher, OllamaEmbedder
+        try:
+            embed_matcher = EmbeddingMatcher(
+                OllamaEmbedder(EMBED_MATCH_MODEL), load_spec_names,
+                min_score=EMBED_MATCH_MIN_SCORE, use_ivf=EMBED_MATCH_IVF,
+            )
+            embedded = embed_matcher.match([queries[i] for i in missing])
+            for i, match in zip(missing, embedded):
+                matches[i] = match
+                if match:
+                    methods[i] = "embedding"
+            found = sum(1 for match in embedded if match)
+            print(f"   🧠 Matcher por embeddings: {found}/{len(missing)} nombres con match.")
+        except Exception as e:
+            print(f"   ⚠️  Matcher por embeddings falló: {e}")
 
-        print("   🔍 Analizando y deduplicando...")
+    audit = []
+    now = datetime.now().isoformat()
+    for (key, raw_type, name, brand), match, method in zip(to_match, matches, methods):
+        spec_id, found_table = (match[0], match[1]) if match else (None, None)
+        match_cache.put(key, spec_id, found_table)
+        results[key] = (spec_id, found_table)
+        if match:
+            audit.append({
+                "at": now,
+                "method": method,
+                "stores": sorted((stores or {}).get(key, [])),
+                "type": raw_type,
+                "scraped_name": name,
+                "scraped_brand": brand,
+                "spec_id": spec_id,
+                "spec_table": found_table,
+                "spec_name": matcher.spec_name(found_table, spec_id),
+                "score": round(match[2], 4),
+            })
+    write_name_match_audit(audit)
+    if audit:
+        print(f"   📝 {len(audit)} matches por nombre nuevos -> {NAME_MATCH_AUDIT_FILE}")
+    return results
+
+def build_resolution_map(batches=None):
+    """
+    Etapa de resolución previa a las tiendas: junta las claves (tipo, part #)
+    distintas de TODAS las tiendas y resuelve cada una una sola vez, en
+    paralelo. Los items sin part # o sin match pasan luego por el matcher por
+    nombre. Retorna { match_key | name_match_key: (spec_id, tabla) }.
+    batches: iterable de (store_name, items); por defecto lee Outputs.
+    """
+    print("\n🧭 Resolviendo part numbers de todas las tiendas...")
+    if batches is None:
+        batches = iter_store_batches(SCRAP_OUTPUT_DIR, LOADER_WORKERS)
+    pending = {}
+    name_pending = {}  # { name_key: [(tipo, nombre, marca), {part_keys}, {tiendas}] }
+    total_items = 0
+    for store_name, items in batches:
         for item in items:
             raw_type = item.get("type")
             part_num = item.get("part #")
-            price = item.get("price")
-            url = item.get("url")
-            source_file = item.get("_source_file", "unknown")
-            
-            if not raw_type or not part_num or not price: continue
-
-            target_tables = CATEGORY_TO_TABLE.get(raw_type)
-            if not target_tables: continue
-            
-            # Buscamos ID
-            spec_id, found_table = find_spec_id(target_tables, part_num)
-            
-            if spec_id and found_table:
-                try:
-                    price_int = int(price)
-                except:
-                    continue
-
-                # LÓGICA DE PRECIO MÍNIMO:
-                if spec_id in unique_products_today:
-                    # Ya vimos este producto hoy. ¿El nuevo es más barato?
-                    existing_price = unique_products_today[spec_id]['price_int']
-                    if price_int < existing_price:
-                        # Reemplazamos con el más barato
-                        unique_products_today[spec_id] = {
-                            "spec_id": spec_id,
-                            "table": found_table,
-                            "price_int": price_int,
-                            "url": url,
-                            "image_url": item.get("image_url"),
-                        }
-                else:
-                    # Primera vez que vemos este producto hoy
-                    unique_products_today[spec_id] = {
-                        "spec_id": spec_id,
-                        "table": found_table,
-                        "price_int": price_int,
-                        "url": url,
-                        "image_url": item.get("image_url"),
-                    }
-            else:
-                unmatched_buffer.append(f"[{source_file}] {url} | TYPE: {raw_type} | PN: {part_num}")
-
-        # Escribir logs de no encontrados
-        if unmatched_buffer:
-            with open(LOG_FILE, 'a', encoding='utf-8') as log:
-                for entry in unmatched_buffer:
-                    log.write(entry + "\n")
-
-        print(f"   💾 Insertando {len(unique_products_today)} productos únicos en DB...")
-
-        # --- FASE B: Inserción en Base de Datos ---
-        # Ahora recorremos la lista limpia (sin duplicados, precio mínimo garantizado)
-        
-        found_ids_today = set()
-
-        for spec_id, data in unique_products_today.items():
-            found_ids_today.add(spec_id)
-            
-            # 1. Upsert ProductPricing (Estado Actual)
-            supabase.table("ProductPricing").upsert({
-                "SpecId": spec_id,
-                "SpecTableName": data["table"],
-                "StoreId": store_id,
-                "Price": data["price_int"],
-                "StockStatus": True,
-                "Url": data["url"],
-                "LastUpdated": datetime.now().isoformat()
-            }, on_conflict="SpecId, SpecTableName, StoreId").execute()
-            
-            # 2. Insert PriceHistory (Nueva entrada siempre)
-            # Como ya deduplicamos, esto solo insertará 1 vez por producto por ejecución.
-            supabase.table("PriceHistory").insert({
-                "SpecId": spec_id,
-                "SpecTableName": data["table"],
-                "StoreId": store_id,
-                "Price": data["price_int"],
-                "RecordedAt": datetime.now().isoformat()
-            }).execute()
-            
-            # 3. Procesar imagen del producto si existe y no es N/A
-            if "image_url" in data and data["image_url"] != "N/A":
-                process_product_image(spec_id, data["table"], data["image_url"])
+            if not raw_type or not item.get("price"): continue
+            if raw_type not in CATEGORY_TO_TABLE: continue
+            total_items += 1
+            part_key = None
+            if has_part_number(part_num):
+                part_key = match_key(raw_type, part_num)
+                pending.setdefault(part_key, (raw_type, part_num))
+            name = item.get("scraped_name")
+            if NAME_MATCH_ENABLED and name and name != "N/A":
+                brand = item.get("scraped_brand")
+                entry = name_pending.setdefault(
+                    name_match_key(raw_type, name, brand), [(raw_type, name, brand), set(), set()]
+                )
+                entry[1].add(part_key)
+                entry[2].add(store_name)
+
+    def resolve(args):
+        raw_type, part_num = args
+        return resolve_spec(raw_type, CATEGORY_TO_TABLE[raw_type], part_num)
+
+    if async_io is not None:
+        resolved = dict(zip(pending.keys(), async_io.gather([
+            resolve_spec_async(raw_type, CATEGORY_TO_TABLE[raw_type], part_num)
+            for raw_type, part_num in pending.values()
+        ])))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, RESOLVE_WORKERS)) as executor:
+            resolved = dict(zip(pending.keys(), executor.map(resolve, pending.values())))
+
+    found = sum(1 for spec_id, _ in resolved.values() if spec_id)
+    print(f"   🧭 {total_items} items -> {len(resolved)} claves distintas, {found} con match.")
+
+    # Respaldo por nombre: solo nombres con algún item sin part # o sin match
+    name_candidates = {
+        key: args for key, (args, part_keys, _) in name_pending.items()
+        if any(pk is None or not resolved[pk][0] for pk in part_keys)
+    }
+    if name_candidates:
+        try:
+            by_name = resolve_by_name(
+                name_candidates, {key: name_pending[key][2] for key in name_candidates}
+            )
+            resolved.update(by_name)
+            found = sum(1 for spec_id, _ in by_name.values() if spec_id)
+            print(f"   🔤 Matcher por nombre: {found}/{len(name_candidates)} nombres con match.")
+        except Exception as e:
+            print(f"   ⚠️  Matcher por nombre falló: {e}")
+    return resolved
+
+def match_items(items, resolved=None):
+    """
+    Fase A: asigna SpecId a cada item y deduplica quedándose con el precio
+    mínimo por producto. Retorna ({spec_id: datos}, [items sin match]).
+    """
+    # --- FASE A: Deduplicación en Memoria ---
+    # Usaremos un diccionario donde la clave sea el SpecId (el producto único)
+    # y el valor sea el item con el MENOR precio encontrado.
+    unique_products_today = {} # { "UUID-XXX": {data_del_item_mas_barato} }
+
+    # Items sin match (se escriben después al log y al JSONL)
+    unmatched_buffer = []
+
+    print("   🔍 Analizando y deduplicando...")
+    for item in items:
+        raw_type = item.get("type")
+        price = item.get("price")
+
+        if not raw_type or not price: continue
+
+        target_tables = CATEGORY_TO_TABLE.get(raw_type)
+        if not target_tables: continue
+
+        spec_id, found_table = resolve_item(item, resolved)
+        # La resolución queda en el item para el snapshot de la tienda
+        item["_spec"], item["_table"] = spec_id, found_table
+
+        if spec_id and found_table:
+            keep_min_price(unique_products_today, spec_id, found_table, item)
+        else:
+            unmatched_buffer.append(item)
+
+    return unique_products_today, unmatched_buffer
+
+def resolve_item(item, resolved=None):
+    """(spec_id, tabla) de un item: por part # y, si no, por nombre."""
+    raw_type = item.get("type")
+    part_num = item.get("part #")
+    target_tables = CATEGORY_TO_TABLE.get(raw_type)
+    if not target_tables:
+        return None, None
+
+    # Buscamos ID (mapa de la etapa de resolución, o cache/DB como respaldo)
+    spec_id, found_table = None, None
+    if has_part_number(part_num):
+        key = match_key(raw_type, part_num)
+        if resolved is not None and key in resolved:
+            spec_id, found_table = resolved[key]
+        else:
+            spec_id, found_table = resolve_spec(raw_type, target_tables, part_num)
+
+    # Respaldo: match por nombre resuelto en la etapa previa
+    if not spec_id and resolved is not None:
+        name_key = name_match_key(raw_type, item.get("scraped_name"), item.get("scraped_brand"))
+        spec_id, found_table = resolved.get(name_key, (None, None))
+    return spec_id, found_table
+
+def keep_min_price(unique_products_today, spec_id, found_table, item):
+    """Agrega el item al dict deduplicado si es el más barato visto para su SpecId."""
+    try:
+        price_int = int(item.get("price"))
+    except:
+        return
+    if item.get("url") in QUARANTINED_URLS:
+        return
+
+    # LÓGICA DE PRECIO MÍNIMO:
+    existing = unique_products_today.get(spec_id)
+    if existing is not None and price_int >= existing['price_int']:
+        return
+    # Primera vez que vemos este producto hoy, o el nuevo es más barato
+    unique_products_today[spec_id] = {
+        "spec_id": spec_id,
+        "table": found_table,
+        "price_int": price_int,
+        "url": item.get("url"),
+        "image_url": item.get("image_url"),
+    }
+
+def pricing_row(spec_id, data, store_id):
+    return {
+        "SpecId": spec_id,
+        "SpecTableName": data["table"],
+        "StoreId": store_id,
+        "Price": data["price_int"],
+        "StockStatus": True,
+        "Url": data["url"],
+        "LastUpdated": datetime.now().isoformat()
+    }
+
+def history_row(spec_id, data, store_id):
+    return {
+        "SpecId": spec_id,
+        "SpecTableName": data["table"],
+        "StoreId": store_id,
+        "Price": data["price_int"],
+        "RecordedAt": datetime.now().isoformat()
+    }
+
+def write_pricing(store_id, unique_products_today):
+    """Fase B: upsert de ProductPricing, PriceHistory (solo cambios) e imágenes."""
+    print(f"   💾 Insertando {len(unique_products_today)} productos únicos en DB...")
+
+    # --- FASE B: Inserción en Base de Datos ---
+    # Ahora recorremos la lista limpia (sin duplicados, precio mínimo garantizado)
+    if async_io is not None:
+        async_io.run(write_pricing_async(store_id, unique_products_today))
+        return
+
+    for spec_id, data in unique_products_today.items():
+        # 1. Upsert ProductPricing (Estado Actual)
+        supabase.table("ProductPricing").upsert(
+            pricing_row(spec_id, data, store_id), on_conflict="SpecId, SpecTableName, StoreId"
+        ).execute()
+
+        # 2. Insert PriceHistory (solo si cambió el precio / volvió a stock / heartbeat)
+        # Como ya deduplicamos, esto inserta como mucho 1 vez por producto por ejecución.
+        key = price_key(spec_id, data["table"], store_id)
+        record_history = price_cache.needs_history(key, data["price_int"])
+        if record_history:
+            supabase.table("PriceHistory").insert(history_row(spec_id, data, store_id)).execute()
+        price_cache.update(key, data["price_int"], recorded=record_history)
+
+    # 3. Procesar imágenes de los productos
+    process_snapshot_images(unique_products_today)
+
+def process_snapshot_images(unique_products_today):
+    for spec_id, data in unique_products_today.items():
+        if data.get("image_url") and data["image_url"] != "N/A":
+            process_product_image(spec_id, data["table"], data["image_url"])
+
+def apply_store_snapshot(store_name, unique_products_today):
+    """
+    Fases B y C en una sola llamada: la función apply_store_snapshot hace el
+    upsert, el historial (solo cambios), el stock agotado y el stamp de la
+    tienda en una transacción. Solo las imágenes quedan del lado del cliente.
+    """
+    print(f"   💾 Aplicando snapshot de {len(unique_products_today)} productos (RPC)...")
+    params = snapshot_params(store_name, unique_products_today, PRICE_HISTORY_HEARTBEAT_DAYS)
+    try:
+        result = supabase.rpc(SNAPSHOT_FUNCTION, params).execute().data
+    except Exception as e:
+        raise RuntimeError(f"RPC {SNAPSHOT_FUNCTION} falló (¿está instalado {SNAPSHOT_SQL_FILE.name}?): {e}") from e
+    store_id = result["store_id"]
+
+    # El cache local de precios se mantiene al día con lo que decidió el servidor
+    recorded = {(row["SpecId"], row["SpecTableName"]) for row in result["history"]}
+    for spec_id, data in unique_products_today.items():
+        price_cache.update(
+            price_key(spec_id, data["table"], store_id), data["price_int"],
+            recorded=(spec_id, data["table"]) in recorded,
+        )
+    for row in result["out_of_stock"]:
+        price_cache.mark_out_of_stock(price_key(row["SpecId"], row["SpecTableName"], store_id))
+
+    print(f"   🧾 {len(recorded)} filas de historial.")
+    if result["out_of_stock"]:
+        print(f"   📉 {len(result['out_of_stock'])} productos marcados como NO DISPONIBLES.")
+
+    process_snapshot_images(unique_products_today)
+
+def process_store(store_name, items, resolved=None):
+    previous = None
+    if RUN_OPTIONS["incremental"] and not SNAPSHOT_RPC_ENABLED:
+        previous = load_usable_snapshot(store_name)
+    if previous is not None:
+        return process_store_incremental(store_name, items, previous, resolved)
+
+    print(f"\n🔵 Tienda: {store_name} - Items brutos: {len(items)}")
+
+    unique_products_today, unmatched_buffer = match_items(items, resolved)
+    for item in unmatched_buffer:
+        item.setdefault("store_name", store_name)
+
+    if SNAPSHOT_RPC_ENABLED:
+        apply_store_snapshot(store_name, unique_products_today)
+    else:
+        store_id = get_or_create_store(store_name)
+        write_pricing(store_id, unique_products_today)
+        found_ids_today = set(unique_products_today)
 
         # --- FASE C: Stock Agotado ---
         print("   🔄 Verificando stock agotado...")
         active_products = supabase.table("ProductPricing")\
-            .select("SpecId")\
+            .select("SpecId, SpecTableName")\
             .eq("StoreId", store_id)\
             .eq("StockStatus", True)\
             .execute()
-            
-        active_ids_db = {row['SpecId'] for row in active_products.data}
-        missing_ids = active_ids_db - found_ids_today
-        
-        if missing_ids:
-            print(f"   📉 {len(missing_ids)} productos marcados como NO DISPONIBLES.")
-            for missing in missing_ids:
-                supabase.table("ProductPricing").update({
-                    "StockStatus": False,
-                    "LastUpdated": datetime.now().isoformat()
-                }).eq("SpecId", missing).eq("StoreId", store_id).execute()
+        missing = {
+            row['SpecId']: row['SpecTableName'] for row in active_products.data
+            if row['SpecId'] not in found_ids_today
+        }
+        mark_out_of_stock(store_id, missing)
+
+    if RUN_OPTIONS["incremental"]:
+        snapshot_store.save(
+            store_name, normalize_items(items, QUARANTINED_URLS), RUN_OPTIONS["spec_version"], date.today().isoformat()
+        )
+
+    # Los logs de no encontrados los escribe el orquestador, en orden de tienda
+    return unmatched_buffer
+
+def mark_out_of_stock(store_id, missing):
+    """Fase C: marca como agotados los {spec_id: tabla} dados y estampa la tienda."""
+    for spec_id, table_name in missing.items():
+        price_cache.mark_out_of_stock(price_key(spec_id, table_name, store_id))
+
+    if missing and async_io is not None:
+        print(f"   📉 {len(missing)} productos marcados como NO DISPONIBLES.")
+        async_io.run(mark_out_of_stock_async(store_id, missing))
+    elif missing:
+        print(f"   📉 {len(missing)} productos marcados como NO DISPONIBLES.")
+        for spec_id in missing:
+            supabase.table("ProductPricing").update({
+                "StockStatus": False,
+                "LastUpdated": datetime.now().isoformat()
+            }).eq("SpecId", spec_id).eq("StoreId", store_id).execute()
+
+    supabase.table("Stores").update({"LastScrapedAt": datetime.now().isoformat()}).eq("Id", store_id).execute()
+
+def load_usable_snapshot(store_name):
+    """Snapshot anterior de la tienda si sirve para una corrida incremental, si no None."""
+    snapshot = snapshot_store.load(store_name)
+    max_age = FULL_REFRESH_DAYS
+    if PRICE_HISTORY_HEARTBEAT_DAYS > 0:
+        # Los heartbeats de PriceHistory solo salen en corridas completas
+        max_age = min(max_age, PRICE_HISTORY_HEARTBEAT_DAYS) if max_age > 0 else PRICE_HISTORY_HEARTBEAT_DAYS
+    if snapshot_store.usable(snapshot, RUN_OPTIONS["spec_version"], max_age):
+        return snapshot
+    return None
+
+def process_store_incremental(store_name, items, previous, resolved=None):
+    """
+    Corrida incremental de una tienda: solo se resuelven las filas agregadas o
+    cambiadas respecto al snapshot anterior, y solo se escriben los SpecId
+    afectados (recalculando su precio mínimo con todas las filas actuales).
+    Los SpecId que se quedan sin filas pasan directo a la fase C.
+    """
+    new_rows = normalize_items(items, QUARANTINED_URLS)
+    diff = diff_rows(previous["rows"], new_rows)
+    print(f"\n🔵 Tienda: {store_name} - Items brutos: {len(items)} (incremental {diff.summary()})")
+
+    affected = {}
+    def touch(row):
+        if row.get("_spec") and row.get("_table"):
+            affected[row["_spec"]] = row["_table"]
+
+    for row in diff.removed:
+        touch(row)
+    for old, new in diff.unchanged:
+        # Solo si la cuarentena cambió desde la corrida anterior: una fila que
+        # entra obliga a recalcular su spec y una que sale vuelve a escribirse
+        if bool(old.get("_quarantined")) != new["_quarantined"]:
+            touch(old)
+    for old, new in diff.changed:
+        touch(old)
+        new["_spec"], new["_table"] = resolve_item(new, resolved)
+        touch(new)
+    for row in diff.added:
+        row["_spec"], row["_table"] = resolve_item(row, resolved)
+        touch(row)
+    for old, new in diff.unchanged:
+        new["_spec"], new["_table"] = old.get("_spec"), old.get("_table")
 
-        supabase.table("Stores").update({"LastScrapedAt": datetime.now().isoformat()}).eq("Id", store_id).execute()
+    unique_products_today = {}
+    unmatched_buffer = []
+    for row in new_rows:
+        if not row.get("_spec") or not row.get("_table"):
+            if row.get("type") in CATEGORY_TO_TABLE:
+                unmatched_buffer.append({**row, "store_name": store_name})
+        elif row["_spec"] in affected:
+            keep_min_price(unique_products_today, row["_spec"], row["_table"], row)
+    gone = {spec_id: table for spec_id, table in affected.items() if spec_id not in unique_products_today}
 
+    store_id = get_or_create_store(store_name)
+    write_pricing(store_id, unique_products_today)
+    mark_out_of_stock(store_id, gone)
+
+    snapshot_store.save(store_name, new_rows, RUN_OPTIONS["spec_version"], previous.get("full_at"))
+    return unmatched_buffer
+
+def write_unmatched_log(unmatched_buffer):
+    """Agrega los items sin match al log de texto y al JSONL estructurado."""
+    if unmatched_buffer:
+        with open(LOG_FILE, 'a', encoding='utf-8') as log:
+            for item in unmatched_buffer:
+                log.write(f"[{item.get('_source_file', 'unknown')}] {item.get('url')} | TYPE: {item.get('type')} | PN: {item.get('part #')}\n")
+        UNMATCHED_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(UNMATCHED_FILE, 'a', encoding='utf-8') as f:
+            for item in unmatched_buffer:
+                record = {field: item.get(field) for field in UNMATCHED_FIELDS}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def start_unmatched_log(title):
+    with open(LOG_FILE, 'w', encoding='utf-8') as log:
+        log.write(f"--- {title}: {datetime.now()} ---\n")
+    UNMATCHED_FILE.parent.mkdir(parents=True, exist_ok=True)
+    open(UNMATCHED_FILE, 'w', encoding='utf-8').close()
+
+def load_unmatched_items():
+    """Lee el JSONL de la última ejecución agrupado por tienda: {tienda: [items]}."""
+    stores = {}
+    with open(UNMATCHED_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            stores.setdefault(item.get("store_name") or "unknown", []).append(item)
+    return stores
+
+
+def process_stores_concurrently(batches, resolved):
+    """
+    Procesa hasta STORE_WORKERS tiendas a la vez. Como mucho hay STORE_WORKERS
+    tiendas cargadas en memoria, y los logs de no encontrados se escriben en el
+    mismo orden en que se leyeron las tiendas.
+    """
+    print(f"⚡ Modo concurrente: {STORE_WORKERS} tiendas en paralelo.")
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=STORE_WORKERS) as executor:
+        for store_name, items in batches:
+            if len(pending) >= STORE_WORKERS:
+                # Esperamos a la tienda más antigua antes de cargar otra
+                write_unmatched_log(pending.popleft().result())
+            pending.append(executor.submit(process_store, store_name, items, resolved))
+        while pending:
+            write_unmatched_log(pending.popleft().result())
+
+def item_keys(item):
+    """Claves de resolución de un item: (clave part #, clave nombre)."""
+    raw_type = item.get("type")
+    part_num = item.get("part #")
+    part_key = match_key(raw_type, part_num) if has_part_number(part_num) else None
+    name = item.get("scraped_name")
+    name_key = None
+    if NAME_MATCH_ENABLED and name and name != "N/A":
+        name_key = name_match_key(raw_type, name, item.get("scraped_brand"))
+    return part_key, name_key
+
+def observe_prices(batches, observations):
+    """Pasa las tiendas tal cual, anotando el precio de cada item para la etapa de outliers."""
+    for store_name, items in batches:
+        for item in items:
+            if item.get("type") not in CATEGORY_TO_TABLE:
+                continue
+            try:
+                price = int(item.get("price"))
+            except (TypeError, ValueError):
+                continue
+            if price > 0:
+                summary = {k: item.get(k) for k in ("url", "type", "part #", "scraped_name")}
+                observations.add(store_name, summary, price, item_keys(item))
+        yield store_name, items
+
+def lookup_resolution(key, resolved):
+    """SpecId ya resuelto para una clave (mapa de esta corrida o cache), sin ir a la DB."""
+    if key is None:
+        return None
+    if key in resolved:
+        return resolved[key][0]
+    cached, spec_id, _ = match_cache.get(key)
+    return spec_id if cached else None
+
+def detect_price_outliers(observations, resolved):
+    """
+    Validación posterior a la resolución: agrupa los precios de todas las
+    tiendas por SpecId y pone en cuarentena los atípicos (mediana/MAD sobre
+    log-precio, vectorizado). Llena QUARANTINED_URLS y escribe el reporte.
+    """
+    QUARANTINED_URLS.clear()
+    spec_codes = {}
+    store_codes = {}
+    indices, groups, stores = [], [], []
+    for i, (part_key, name_key) in enumerate(observations.keys):
+        spec_id = lookup_resolution(part_key, resolved) or lookup_resolution(name_key, resolved)
+        if spec_id:
+            indices.append(i)
+            groups.append(spec_codes.setdefault(spec_id, len(spec_codes)))
+            stores.append(store_codes.setdefault(observations.stores[i], len(store_codes)))
+    prices = [observations.prices[i] for i in indices]
+
+    mask, medians, scores = find_outliers(
+        groups, prices, stores,
+        min_stores=PRICE_OUTLIER_MIN_STORES,
+        max_modified_z=PRICE_OUTLIER_MAX_Z,
+        min_ratio=PRICE_OUTLIER_MIN_RATIO,
+    )
+    spec_ids = list(spec_codes)
+    report = []
+    for pos in mask.nonzero()[0]:
+        i = indices[pos]
+        item = observations.items[i]
+        QUARANTINED_URLS.add(item.get("url"))
+        report.append({
+            "store_name": observations.stores[i],
+            "url": item.get("url"),
+            "type": item.get("type"),
+            "part #": item.get("part #"),
+            "scraped_name": item.get("scraped_name"),
+            "price": observations.prices[i],
+            "spec_id": spec_ids[groups[pos]],
+            "median_price": int(round(medians[pos])),
+            "modified_z": round(float(scores[pos]), 2) if math.isfinite(scores[pos]) else None,
+        })
+    write_report(report)
+    print(f"   🧪 Precios: {len(prices)} observaciones en {len(spec_codes)} specs, {len(report)} en cuarentena.")
+    for entry in report[:5]:
+        print(f"      ⚠️  {entry['store_name']}: ${entry['price']} vs mediana ${entry['median_price']} ({entry['url']})")
+    if report:
+        print(f"      Reporte completo en '{OUTLIER_REPORT_FILE}'.")
+
+def rows_to_resolve(batches):
+    """
+    Para la etapa de resolución: las tiendas con snapshot utilizable solo
+    aportan las filas agregadas o cambiadas; el resto, todos sus items.
+    """
+    for store_name, items in batches:
+        previous = None
+        if RUN_OPTIONS["incremental"] and not SNAPSHOT_RPC_ENABLED:
+            previous = load_usable_snapshot(store_name)
+        if previous is None:
+            yield store_name, items
+            continue
+        diff = diff_rows(previous["rows"], normalize_items(items))
+        yield store_name, diff.added + [new for _, new in diff.changed]
+
+def process_daily_scraps(full_run=False):
+    print("🚀 Iniciando procesamiento (Con Deduplicación y Precio Mínimo)...")
+    
+    if not os.path.exists(SCRAP_OUTPUT_DIR):
+        print("❌ Directorio no encontrado.")
+        return
+
+    start_unmatched_log("Reporte de No Match")
+
+    prefetch_image_status()
+    price_cache.load(bootstrap=bootstrap_last_prices)
+    match_cache.load(read_spec_version(), NAME_MATCH_RULES)
+
+    RUN_OPTIONS["spec_version"] = read_spec_version()
+    RUN_OPTIONS["incremental"] = INCREMENTAL_ENABLED and not full_run
+
+    # 1. Resolución de part numbers (una vez por clave, para todas las tiendas)
+    observations = PriceObservations() if PRICE_OUTLIER_ENABLED else None
+    batches = iter_store_batches(SCRAP_OUTPUT_DIR, LOADER_WORKERS)
+    if observations is not None:
+        batches = observe_prices(batches, observations)
+    resolved = build_resolution_map(rows_to_resolve(batches))
+
+    # 2. Validación de precios entre tiendas (antes de escribir nada)
+    if observations is not None:
+        detect_price_outliers(observations, resolved)
+
+    # 3. Lectura de Archivos (streaming, una tienda a la vez)
+    totals = {"items": 0}
+    def counted_batches():
+        for store_name, items in iter_store_batches(SCRAP_OUTPUT_DIR, LOADER_WORKERS):
+            totals["items"] += len(items)
+            yield store_name, items
+
+    # 4. Procesamiento por Tienda
+    if STORE_WORKERS <= 1:
+        for store_name, items in counted_batches():
+            write_unmatched_log(process_store(store_name, items, resolved))
+    else:
+        process_stores_concurrently(counted_batches(), resolved)
+
+    price_cache.save()
+    match_cache.save()
+    print(f"   🗂️  Cache de matches: {match_cache.hits} aciertos, {match_cache.misses} búsquedas.")
+
+    if async_io is not None:
+        async_io.close()
+    backend_stats.report(items=totals["items"])
     print(f"\n🏁 Listo. Logs en '{LOG_FILE}'.")
 
+def filter_cheaper_than_existing(store_id, unique_products):
+    """
+    Descarta los productos que la tienda ya tiene en stock a un precio igual o
+    menor (p.ej. otro item de la misma tienda que sí hizo match en la corrida
+    completa), para mantener el precio mínimo por tienda.
+    """
+    if not unique_products:
+        return unique_products
+    existing = {}
+    spec_ids = list(unique_products)
+    for i in range(0, len(spec_ids), PAGE_SIZE):
+        response = supabase.table("ProductPricing")\
+            .select("SpecId, SpecTableName, Price, StockStatus")\
+            .eq("StoreId", store_id)\
+            .in_("SpecId", spec_ids[i:i + PAGE_SIZE])\
+            .execute()
+        for row in response.data:
+            if row.get("StockStatus") and row.get("Price") is not None:
+                existing[(row["SpecId"], row["SpecTableName"])] = row["Price"]
+    return {
+        spec_id: data for spec_id, data in unique_products.items()
+        if existing.get((spec_id, data["table"])) is None
+        or data["price_int"] < existing[(spec_id, data["table"])]
+    }
+
+def reprocess_unmatched():
+    """
+    Modo --unmatched-only: vuelve a buscar match solo para los items que
+    quedaron sin match en la última ejecución (tras actualizar la DB de specs)
+    y escribe precios para los nuevos aciertos. No lee Outputs ni marca stock
+    agotado: la corrida original ya lo hizo.
+    """
+    print("🚀 Reprocesando items sin match...")
+    if not UNMATCHED_FILE.exists():
+        print(f"❌ No existe '{UNMATCHED_FILE}'. Ejecuta primero el proceso completo.")
+        return
+
+    stores = load_unmatched_items()
+    total = sum(len(items) for items in stores.values())
+    print(f"   📄 {total} items sin match en {len(stores)} tiendas.")
+
+    prefetch_image_status()
+    price_cache.load(bootstrap=bootstrap_last_prices)
+    match_cache.load(read_spec_version(), NAME_MATCH_RULES)
+
+    resolved = build_resolution_map(stores.items())
+
+    start_unmatched_log("Reporte de No Match (reprocesado)")
+    new_hits = 0
+    for store_name, items in stores.items():
+        print(f"\n🔵 Tienda: {store_name} - Items sin match: {len(items)}")
+        unique_products, unmatched_buffer = match_items(items, resolved)
+        if unique_products:
+            store_id = get_or_create_store(store_name)
+            unique_products = filter_cheaper_than_existing(store_id, unique_products)
+            write_pricing(store_id, unique_products)
+            new_hits += len(unique_products)
+            # El snapshot de la tienda no conoce estos matches: próxima corrida completa
+            snapshot_store.invalidate(store_name)
+        write_unmatched_log(unmatched_buffer)
+
+    price_cache.save()
+    match_cache.save()
+    if async_io is not None:
+        async_io.close()
+    backend_stats.report(items=total)
+    print(f"\n🏁 Listo. {new_hits} productos nuevos con precio. Logs en '{LOG_FILE}'.")
+
 if __name__ == "__main__":
-    process_daily_scraps()
+    parser = argparse.ArgumentParser(description="Matchea los outputs de los scrapers con la DB de specs.")
+    parser.add_argument("--unmatched-only", action="store_true",
+                        help="Solo reprocesa los items sin match de la última ejecución (sin leer Outputs)")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignora los snapshots anteriores y procesa todas las tiendas completas")
+    args = parser.parse_args()
+    if args.unmatched_only:
+        reprocess_unmatched()
+    else:
+        process_daily_scraps(full_run=args.full)
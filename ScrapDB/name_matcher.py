@@ -0,0 +1,285 @@
+import re
+import unicodedata
+
+import numpy as np
+
+# ================= NORMALIZACIÓN =================
+
+NGRAM_SIZE = 3
+
+# Solo los n-gramas presentes en a lo más esta fracción de specs generan
+# candidatos (los comunes, como "ddr" o " gb", aportan poco y multiplican
+# los pares). El score final sí usa todos los n-gramas.
+CANDIDATE_MAX_DOCUMENT_FREQUENCY = 0.05
+
+# Candidatas por consulta que pasan a la puntuación exacta
+CANDIDATES_PER_QUERY = 50
+
+# Si las dos mejores specs quedan a menos de este margen, el match es ambiguo
+AMBIGUITY_MARGIN = 0.02
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text):
+    """Minúsculas, sin acentos y solo alfanuméricos separados por un espacio."""
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NON_ALNUM.split(text.lower())).strip()
+
+
+def normalize_brand(brand):
+    """'G.Skill' -> 'gskill'. Retorna '' para marcas vacías o 'N/A'."""
+    key = _NON_ALNUM.sub("", normalize_text(brand))
+    return "" if key in ("", "na", "none", "unknown") else key
+
+
+def name_tokens(normalized):
+    return [t for t in normalized.split(" ") if t]
+
+
+def char_ngrams(normalized):
+    """n-gramas de caracteres por palabra, con bordes (' ddr4 ' -> ' dd', 'ddr', ...)."""
+    grams = {}
+    for token in name_tokens(normalized):
+        padded = f" {token} "
+        if len(padded) <= NGRAM_SIZE:
+            grams[padded] = grams.get(padded, 0) + 1
+            continue
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            gram = padded[i:i + NGRAM_SIZE]
+            grams[gram] = grams.get(gram, 0) + 1
+    return grams
+
+
+def brand_candidates(normalized):
+    """Tokens y concatenaciones de 2-3 tokens seguidos ('g skill' -> 'gskill')."""
+    tokens = name_tokens(normalized)
+    candidates = set(tokens)
+    for size in (2, 3):
+        for i in range(len(tokens) - size + 1):
+            candidates.add("".join(tokens[i:i + size]))
+    return candidates
+
+
+# ================= ÍNDICE =================
+
+class NameIndex:
+    """
+    Índice TF-IDF de n-gramas de caracteres sobre los MetaName de una tabla de
+    specs. Guarda:
+    - una matriz dispersa CSR (spec -> n-gramas, pesos normalizados L2)
+    - un índice invertido solo con n-gramas poco frecuentes, usado para generar
+      candidatos sin recorrer toda la tabla por cada item
+    """
+
+    def __init__(self, table_name, rows):
+        self.table_name = table_name
+        self.spec_ids = []
+        self.spec_names = {}  # spec_id -> MetaName (para el log de auditoría)
+        brands = []
+        documents = []
+        for row in rows:
+            name = normalize_text(row.get("MetaName"))
+            if not name:
+                continue
+            brand = normalize_brand(row.get("MetaManufacturer"))
+            if not brand:
+                # Sin fabricante: PCPP pone la marca como primera palabra del nombre
+                brand = name_tokens(name)[0]
+            self.spec_ids.append(row["Id"])
+            self.spec_names[row["Id"]] = row.get("MetaName")
+            brands.append(brand)
+            documents.append(char_ngrams(name))
+
+        self.size = len(self.spec_ids)
+        self.brand_vocab = {b: i for i, b in enumerate(sorted(set(brands)))}
+        self.spec_brand = np.array([self.brand_vocab[b] for b in brands], dtype=np.int64)
+
+        self.gram_vocab = {}
+        document_frequency = []
+        for grams in documents:
+            for gram in grams:
+                gram_id = self.gram_vocab.setdefault(gram, len(self.gram_vocab))
+                if gram_id == len(document_frequency):
+                    document_frequency.append(0)
+                document_frequency[gram_id] += 1
+        document_frequency = np.array(document_frequency, dtype=np.float64)
+        self.idf = np.log((1 + self.size) / (1 + document_frequency)) + 1.0
+
+        # Matriz CSR spec x n-grama
+        pointers = [0]
+        gram_ids, weights = [], []
+        for grams in documents:
+            ids = np.fromiter((self.gram_vocab[g] for g in grams), dtype=np.int64, count=len(grams))
+            tf = np.fromiter(grams.values(), dtype=np.float64, count=len(grams))
+            row_weights = tf * self.idf[ids]
+            row_weights /= np.linalg.norm(row_weights) or 1.0
+            gram_ids.append(ids)
+            weights.append(row_weights)
+            pointers.append(pointers[-1] + len(ids))
+        self.spec_ptr = np.array(pointers, dtype=np.int64)
+        self.spec_grams = np.concatenate(gram_ids) if gram_ids else np.zeros(0, dtype=np.int64)
+        self.spec_weights = np.concatenate(weights) if weights else np.zeros(0)
+
+        # Índice invertido (solo n-gramas poco frecuentes) para candidatos
+        max_df = max(1, int(CANDIDATE_MAX_DOCUMENT_FREQUENCY * self.size))
+        rare = document_frequency[self.spec_grams] <= max_df
+        rows_of_entry = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(self.spec_ptr))
+        order = np.argsort(self.spec_grams[rare], kind="stable")
+        self.post_grams = self.spec_grams[rare][order]
+        self.post_specs = rows_of_entry[rare][order]
+        self.post_weights = self.spec_weights[rare][order]
+
+    def query_vector(self, normalized):
+        """(ids de n-gramas, pesos normalizados) de un nombre; ignora n-gramas desconocidos."""
+        grams = {g: tf for g, tf in char_ngrams(normalized).items() if g in self.gram_vocab}
+        ids = np.fromiter((self.gram_vocab[g] for g in grams), dtype=np.int64, count=len(grams))
+        tf = np.fromiter(grams.values(), dtype=np.float64, count=len(grams))
+        weights = tf * self.idf[ids]
+        weights /= np.linalg.norm(weights) or 1.0
+        return ids, weights
+
+    def allowed_brands(self, normalized_name, brand):
+        """
+        Gating de marca: si el item trae marca, tiene que ser una marca de la
+        tabla (sin match si no); si no trae, las marcas que aparecen en el nombre.
+        """
+        if brand:
+            return [self.brand_vocab[brand]] if brand in self.brand_vocab else []
+        return [self.brand_vocab[c] for c in brand_candidates(normalized_name) if c in self.brand_vocab]
+
+    def match_batch(self, queries, min_score):
+        """
+        queries: lista de (nombre_normalizado, marca_normalizada).
+        Genera candidatas y las puntúa (coseno TF-IDF exacto) para todo el lote
+        en operaciones vectorizadas. Retorna [(spec_id, score) | None] alineado
+        con `queries`.
+        """
+        results = [None] * len(queries)
+        if not self.size or not queries:
+            return results
+        vocab_size = len(self.gram_vocab)
+        brand_count = len(self.brand_vocab)
+
+        # Matriz dispersa de consultas, como claves ordenadas (consulta * V + n-grama)
+        query_keys, query_weights, allowed_pairs = [], [], []
+        for q_index, (name, brand) in enumerate(queries):
+            brands = self.allowed_brands(name, brand)
+            if not brands:
+                continue
+            ids, weights = self.query_vector(name)
+            query_keys.append(q_index * vocab_size + ids)
+            query_weights.append(weights)
+            allowed_pairs.extend(q_index * brand_count + b for b in brands)
+        if not query_keys:
+            return results
+        query_keys = np.concatenate(query_keys)
+        query_weights = np.concatenate(query_weights)
+        order = np.argsort(query_keys)
+        query_keys, query_weights = query_keys[order], query_weights[order]
+        q_of_entry = query_keys // vocab_size
+        gram_of_entry = query_keys % vocab_size
+
+        # 1. Candidatas: n-gramas poco frecuentes compartidos (índice invertido)
+        starts = np.searchsorted(self.post_grams, gram_of_entry, side="left")
+        ends = np.searchsorted(self.post_grams, gram_of_entry, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return results
+        entry_rep = np.repeat(np.arange(len(lengths)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        posting_idx = np.repeat(starts, lengths) + offsets
+        pair_keys = q_of_entry[entry_rep] * self.size + self.post_specs[posting_idx]
+        partial = self.post_weights[posting_idx] * query_weights[entry_rep]
+        unique_pairs, inverse = np.unique(pair_keys, return_inverse=True)
+        partial_scores = np.bincount(inverse, weights=partial)
+        pair_query = unique_pairs // self.size
+        pair_spec = unique_pairs % self.size
+
+        # Gating de marca antes de recortar
+        brand_keys = pair_query * brand_count + self.spec_brand[pair_spec]
+        keep = np.isin(brand_keys, np.array(allowed_pairs, dtype=np.int64))
+        pair_query, pair_spec, partial_scores = pair_query[keep], pair_spec[keep], partial_scores[keep]
+        if not len(pair_query):
+            return results
+
+        # Top-K candidatas por consulta según el score parcial
+        order = np.lexsort((-partial_scores, pair_query))
+        pair_query, pair_spec = pair_query[order], pair_spec[order]
+        group_start = np.r_[0, np.flatnonzero(pair_query[1:] != pair_query[:-1]) + 1]
+        group_sizes = np.diff(np.r_[group_start, len(pair_query)])
+        rank = np.arange(len(pair_query)) - np.repeat(group_start, group_sizes)
+        keep = rank < CANDIDATES_PER_QUERY
+        pair_query, pair_spec = pair_query[keep], pair_spec[keep]
+
+        # 2. Score exacto: producto punto de cada par (consulta, spec) sobre todos los n-gramas
+        lengths = self.spec_ptr[pair_spec + 1] - self.spec_ptr[pair_spec]
+        total = int(lengths.sum())
+        pair_rep = np.repeat(np.arange(len(pair_spec)), lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entry_idx = np.repeat(self.spec_ptr[pair_spec], lengths) + offsets
+        keys = pair_query[pair_rep] * vocab_size + self.spec_grams[entry_idx]
+        positions = np.minimum(np.searchsorted(query_keys, keys), len(query_keys) - 1)
+        hit = query_keys[positions] == keys
+        scores = np.bincount(
+            pair_rep[hit],
+            weights=self.spec_weights[entry_idx][hit] * query_weights[positions][hit],
+            minlength=len(pair_spec),
+        )
+
+        # 3. Mejor spec por consulta, con umbral y margen contra la segunda
+        order = np.lexsort((-scores, pair_query))
+        pair_query, pair_spec, scores = pair_query[order], pair_spec[order], scores[order]
+        first = np.r_[True, pair_query[1:] != pair_query[:-1]]
+        second_score = np.zeros(len(scores))
+        has_second = np.r_[pair_query[1:] == pair_query[:-1], False]
+        second_score[has_second] = scores[np.flatnonzero(has_second) + 1]
+        accepted = first & (scores >= min_score) & (scores - second_score >= AMBIGUITY_MARGIN)
+        for q_index, s_index, score in zip(pair_query[accepted], pair_spec[accepted], scores[accepted]):
+            results[int(q_index)] = (self.spec_ids[int(s_index)], float(score))
+        return results
+
+
+class NameMatcher:
+    """
+    Matcher de respaldo por nombre (scraped_name/scraped_brand vs MetaName).
+    `load_rows(table_name)` debe retornar las filas (Id, MetaName, MetaManufacturer)
+    de la tabla; cada índice se construye una sola vez por ejecución.
+    """
+
+    def __init__(self, load_rows, min_score=0.85):
+        self.load_rows = load_rows
+        self.min_score = min_score
+        self.indexes = {}
+
+    def index_for(self, table_name):
+        if table_name not in self.indexes:
+            self.indexes[table_name] = NameIndex(table_name, self.load_rows(table_name))
+        return self.indexes[table_name]
+
+    def spec_name(self, table_name, spec_id):
+        index = self.indexes.get(table_name)
+        return index.spec_names.get(spec_id) if index else None
+
+    def match(self, items):
+        """
+        items: lista de (tablas_objetivo, scraped_name, scraped_brand).
+        Retorna [(spec_id, tabla, score) | None] alineado con `items`.
+        """
+        best = [None] * len(items)
+        by_table = {}
+        for position, (tables, name, brand) in enumerate(items):
+            normalized = normalize_text(name)
+            if not normalized:
+                continue
+            for table_name in ([tables] if isinstance(tables, str) else tables):
+                by_table.setdefault(table_name, []).append((position, normalized, normalize_brand(brand)))
+
+        for table_name, entries in by_table.items():
+            index = self.index_for(table_name)
+            matches = index.match_batch([(name, brand) for _, name, brand in entries], self.min_score)
+            for (position, _, _), result in zip(entries, matches):
+                if result and (best[position] is None or result[1] > best[position][2]):
+                    best[position] = (result[0], table_name, result[1])
+        return best
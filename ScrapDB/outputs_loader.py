@@ -0,0 +1,75 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Módulo liviano a propósito: los procesos del pool lo importan sin crear
+# clientes de Supabase ni caches (ver iter_store_batches).
+
+STORE_NAME_RE = re.compile(r'"store_name"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _load_json_file(filepath):
+    """
+    Worker del loader: parsea un archivo de Outputs.
+    Retorna: (nombre_archivo, lista_items, error)
+    """
+    filename = os.path.basename(filepath)
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = json.load(f)
+        if isinstance(content, dict): content = [content]
+        return filename, content, None
+    except Exception as e:
+        return filename, [], str(e)
+
+def _scan_store_names(filepath):
+    """Worker del pre-escaneo: tiendas de un archivo, con una regex (sin parsear el JSON)."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return {json.loads(f'"{name}"') for name in STORE_NAME_RE.findall(f.read())}
+    except Exception:
+        return set()
+
+def iter_store_batches(output_dir, workers=None):
+    """
+    Generador: entrega (store_name, items) de a una tienda por vez, con TODOS
+    sus items. Cada scraper escribe en su propia carpeta (Outputs/<Tienda>),
+    así que se parsea una carpeta a la vez (en paralelo entre procesos) y se
+    libera antes de pasar a la siguiente. Si una tienda aparece en varias
+    carpetas, sus items se juntan y se entrega después de la última: la fase C
+    (marcar sin stock lo que no vino) necesita la tienda completa.
+    """
+    folders = {}
+    for root, dirs, files in os.walk(output_dir):
+        json_files = sorted(f for f in files if f.endswith(".json"))
+        if json_files:
+            folders[root] = [os.path.join(root, f) for f in json_files]
+    roots = sorted(folders)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Pre-escaneo barato: en qué carpeta aparece cada tienda por última vez
+        last_folder = {}
+        for index, root in enumerate(roots):
+            for names in executor.map(_scan_store_names, folders[root], chunksize=64):
+                for s_name in names:
+                    last_folder[s_name] = index
+
+        held = {}
+        for index, root in enumerate(roots):
+            for filename, content, error in executor.map(_load_json_file, folders[root], chunksize=64):
+                if error:
+                    print(f"❌ Error en {filename}: {error}")
+                    continue
+                for item in content:
+                    s_name = item.get("store_name")
+                    if s_name:
+                        item["_source_file"] = filename
+                        held.setdefault(s_name, []).append(item)
+
+            for store_name in [name for name in held if last_folder.get(name, index) <= index]:
+                yield store_name, held.pop(store_name)
+
+        # Por si el pre-escaneo no vio alguna tienda (formato inesperado)
+        for store_name, items in held.items():
+            yield store_name, items
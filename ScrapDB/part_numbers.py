@@ -0,0 +1,34 @@
+from functools import lru_cache
+
+# Columna text[] con los part numbers normalizados de cada tabla de specs
+# (ver SpecDB/sql/part_numbers_array.sql). La lookup exacta usa su índice GIN;
+# la columna de texto legacy "MetaPartNumber" queda solo para mostrar.
+PART_NUMBERS_COLUMN = "part_numbers"
+
+
+def normalize_part_number(value):
+    """Sin espacios repetidos y en mayúsculas (igual que match_cache.match_key)."""
+    return " ".join(str(value).split()).upper()
+
+
+@lru_cache(maxsize=65536)
+def _split_text(text):
+    if text.startswith("[") and text.endswith("]"):
+        items = text[1:-1].split(",")
+    else:
+        items = [text]
+    return tuple(clean for clean in (item.strip().strip("'").strip('"').strip() for item in items) if clean)
+
+
+def split_part_numbers(raw_val):
+    """Lista de part numbers desde una lista real, "[A, B]" (formato legacy) o "A"."""
+    if not raw_val:
+        return []
+    if isinstance(raw_val, (list, tuple)):
+        return [str(v).strip() for v in raw_val if v and str(v).strip()]
+    return list(_split_text(str(raw_val).strip()))
+
+
+def part_numbers_array(raw_val):
+    """Valor de la columna PART_NUMBERS_COLUMN: normalizados, sin repetidos, en orden."""
+    return list(dict.fromkeys(normalize_part_number(p) for p in split_part_numbers(raw_val)))
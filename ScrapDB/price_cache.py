@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+LAST_PRICES_FILE = BASE_DIR / "Cache" / "last_prices.json"
+
+
+def price_key(spec_id, table_name, store_id):
+    return f"{spec_id}|{table_name}|{store_id}"
+
+
+class LastPriceCache:
+    """
+    Último precio conocido por (SpecId, SpecTableName, StoreId), persistido en
+    disco entre ejecuciones. Permite insertar PriceHistory solo cuando algo cambió.
+
+    Entrada: {"price": int, "in_stock": bool, "recorded": "YYYY-MM-DD" | None}
+    `recorded` es la fecha de la última fila escrita en PriceHistory.
+    """
+
+    def __init__(self, path=LAST_PRICES_FILE, heartbeat_days=0):
+        self.path = Path(path)
+        self.heartbeat_days = heartbeat_days
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, bootstrap=None):
+        """
+        Carga el cache desde disco. Si no existe, llama a `bootstrap()` (una
+        sola vez) que debe retornar el dict de entradas armado desde la DB.
+        """
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            return False
+        if bootstrap is not None:
+            self.entries = bootstrap()
+        return True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    def needs_history(self, key, price, today=None):
+        """True si hay que insertar PriceHistory: precio nuevo, cambio de precio,
+        vuelta a stock o heartbeat vencido."""
+        today = today or date.today()
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return True
+        if entry.get("price") != price or not entry.get("in_stock", True):
+            return True
+        if self.heartbeat_days > 0:
+            recorded = entry.get("recorded")
+            if not recorded:
+                return True
+            return (today - date.fromisoformat(recorded)).days >= self.heartbeat_days
+        return False
+
+    def update(self, key, price, recorded=False, today=None):
+        """Registra el estado actual (en stock con `price`)."""
+        today = today or date.today()
+        with self._lock:
+            entry = self.entries.setdefault(key, {})
+            entry["price"] = price
+            entry["in_stock"] = True
+            if recorded:
+                entry["recorded"] = today.isoformat()
+            else:
+                entry.setdefault("recorded", None)
+
+    def mark_out_of_stock(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry["in_stock"] = False
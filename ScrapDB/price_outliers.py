@@ -0,0 +1,99 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+OUTLIER_REPORT_FILE = BASE_DIR / "Cache" / "price_outliers.jsonl"
+
+# Mínimo de tiendas distintas con precio para una spec para poder juzgar
+MIN_STORES = 3
+# Puntaje z modificado (Iglewicz-Hoaglin) sobre log(precio)
+MAX_MODIFIED_Z = 3.5
+# Además del z, el precio debe alejarse al menos este factor de la mediana
+# (evita descartar diferencias chicas cuando casi todas las tiendas coinciden)
+MIN_RATIO = 2.0
+
+
+class PriceObservations:
+    """
+    Precios de TODAS las tiendas de la corrida, juntados en la etapa de
+    resolución: uno por item, con las claves para resolver su SpecId después.
+    """
+
+    def __init__(self):
+        self.stores = []
+        self.items = []
+        self.prices = []
+        self.keys = []
+
+    def add(self, store_name, item, price, keys):
+        self.stores.append(store_name)
+        self.items.append(item)
+        self.prices.append(price)
+        self.keys.append(keys)
+
+    def __len__(self):
+        return len(self.prices)
+
+
+def group_medians(groups, values):
+    """
+    Mediana por grupo, vectorizada. groups: códigos enteros por observación.
+    Retorna la mediana del grupo de cada observación (mismo largo que values).
+    """
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    sorted_values = values[order]
+    _, starts, counts = np.unique(sorted_groups, return_index=True, return_counts=True)
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    medians = (sorted_values[lo] + sorted_values[hi]) / 2.0
+    per_sorted = np.repeat(medians, counts)
+    result = np.empty_like(per_sorted)
+    result[order] = per_sorted
+    return result
+
+
+def find_outliers(groups, prices, stores, min_stores=MIN_STORES,
+                  max_modified_z=MAX_MODIFIED_Z, min_ratio=MIN_RATIO):
+    """
+    Marca precios atípicos por grupo (spec) con mediana/MAD sobre log(precio),
+    en una sola pasada para todo el lote. stores: código entero de la tienda
+    de cada observación; un grupo se juzga solo si tiene min_stores tiendas
+    distintas (varias publicaciones de una misma tienda cuentan como una).
+    Retorna (mascara_outlier, mediana_del_grupo, z_modificado).
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    stores = np.asarray(stores, dtype=np.int64)
+    if len(prices) == 0:
+        empty = np.zeros(0)
+        return empty.astype(bool), empty, empty
+
+    log_prices = np.log(np.maximum(prices, 1.0))
+    median_log = group_medians(groups, log_prices)
+    deviation = np.abs(log_prices - median_log)
+    mad = group_medians(groups, deviation)
+    # Tiendas distintas por grupo: pares (grupo, tienda) únicos contados por grupo
+    pairs = np.unique(np.stack((groups, stores), axis=1), axis=0)
+    store_counts = np.bincount(pairs[:, 0], minlength=groups.max() + 1)[groups]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        modified_z = np.where(mad > 0, 0.6745 * deviation / mad, np.where(deviation > 0, np.inf, 0.0))
+
+    mask = (store_counts >= min_stores) & (modified_z > max_modified_z) & (deviation > np.log(min_ratio))
+    return mask, np.exp(median_log), modified_z
+
+
+def write_report(entries, path=OUTLIER_REPORT_FILE):
+    """Reescribe el reporte de cuarentena (JSONL, una línea por item descartado)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+from datetime import date
+from pathlib import Path
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+SNAPSHOT_DIR = BASE_DIR / "Cache" / "snapshots"
+
+# Campos del item que se guardan en el snapshot (mismos nombres que en Outputs,
+# así las filas pasan tal cual por match_items) más la resolución (_spec, _table).
+# Además cada fila guarda _quarantined (si su precio quedó en cuarentena)
+SNAPSHOT_FIELDS = (
+    "url", "type", "part #", "price", "scraped_name", "scraped_brand", "image_url", "_source_file",
+    "_spec", "_table",
+)
+
+# Campos que, si cambian, obligan a re-resolver y re-escribir la fila
+COMPARED_FIELDS = ("type", "part #", "price", "scraped_name", "scraped_brand", "image_url")
+
+
+def url_hash(url):
+    return hashlib.sha1((url or "").encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_items(items, quarantined=()):
+    """
+    Snapshot normalizado de una tienda: una fila por URL (si una URL se repite
+    queda la de menor precio), ordenado por hash de URL para el merge.
+    quarantined: URLs con precio en cuarentena en esta corrida.
+    """
+    by_hash = {}
+    for item in items:
+        url = item.get("url")
+        if not url or not item.get("type") or not item.get("price"):
+            continue
+        row = {field: item.get(field) for field in SNAPSHOT_FIELDS}
+        row["_h"] = url_hash(url)
+        row["_quarantined"] = url in quarantined
+        previous = by_hash.get(row["_h"])
+        if previous is None or _price(row) < _price(previous):
+            by_hash[row["_h"]] = row
+    return [by_hash[h] for h in sorted(by_hash)]
+
+
+def _price(row):
+    try:
+        return int(row.get("price"))
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+class SnapshotDiff:
+    def __init__(self):
+        self.added = []      # filas nuevas
+        self.removed = []    # filas del snapshot anterior que ya no están
+        self.changed = []    # (anterior, nueva) con misma URL y algún campo distinto
+        self.unchanged = []  # (anterior, nueva) idénticas
+
+    def summary(self):
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)} ={len(self.unchanged)}"
+
+
+def diff_rows(old_rows, new_rows):
+    """Merge de dos snapshots ordenados por `_h` en O(n + m)."""
+    diff = SnapshotDiff()
+    i = j = 0
+    while i < len(old_rows) and j < len(new_rows):
+        old, new = old_rows[i], new_rows[j]
+        if old["_h"] == new["_h"]:
+            if any(old.get(f) != new.get(f) for f in COMPARED_FIELDS):
+                diff.changed.append((old, new))
+            else:
+                diff.unchanged.append((old, new))
+            i += 1
+            j += 1
+        elif old["_h"] < new["_h"]:
+            diff.removed.append(old)
+            i += 1
+        else:
+            diff.added.append(new)
+            j += 1
+    diff.removed.extend(old_rows[i:])
+    diff.added.extend(new_rows[j:])
+    return diff
+
+
+class SnapshotStore:
+    """
+    Último snapshot procesado por tienda (Cache/snapshots/<tienda>.json), con
+    la resolución (SpecId, tabla) de cada fila y la metadata de la corrida:
+    {"spec_version": ..., "full_at": "YYYY-MM-DD", "rows": [...]}
+    """
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        self.dir = Path(snapshot_dir)
+
+    def path(self, store_name):
+        safe = re.sub(r"[^\w.-]+", "_", store_name)
+        return self.dir / f"{safe}.json"
+
+    def load(self, store_name):
+        path = self.path(store_name)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, store_name, rows, spec_version, full_at):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.path(store_name)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"spec_version": spec_version, "full_at": full_at, "rows": rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, store_name):
+        """La próxima corrida de la tienda será completa."""
+        try:
+            self.path(store_name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def usable(self, snapshot, spec_version, max_age_days, today=None):
+        """True si se puede hacer una corrida incremental contra este snapshot."""
+        if not snapshot or snapshot.get("spec_version") != spec_version:
+            return False
+        if max_age_days > 0:
+            full_at = snapshot.get("full_at")
+            if not full_at:
+                return False
+            today = today or date.today()
+            if (today - date.fromisoformat(full_at)).days >= max_age_days:
+                return False
+        return True
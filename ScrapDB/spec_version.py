@@ -0,0 +1,30 @@
+import json
+import os
+import uuid as uuid_lib
+from datetime import datetime
+from pathlib import Path
+
+# Marcador de versión de la base de specs. Lo escribe SpecDB/UpdateToSupabase.py
+# cada vez que cambia filas de especificaciones; los caches del matcher que
+# dependen de las specs se invalidan cuando cambia.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SPEC_VERSION_FILE = REPO_ROOT / "SpecDB" / "ScrapDatabaseCache" / "spec_db_version.json"
+
+
+def read_spec_version(path=SPEC_VERSION_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def bump_spec_version(path=SPEC_VERSION_FILE):
+    version = uuid_lib.uuid4().hex
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": version, "updated_at": datetime.now().isoformat()}, f, indent=4)
+    os.replace(tmp_path, path)
+    return version
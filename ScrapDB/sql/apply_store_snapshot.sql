@@ -0,0 +1,105 @@
+-- Aplica el snapshot deduplicado de una tienda en UNA transacción:
+--   1. PriceHistory solo para productos nuevos, con precio distinto, que
+--      vuelven a stock o con heartbeat vencido (p_heartbeat_days > 0)
+--   2. Upsert de ProductPricing (en stock, precio y url del día)
+--   3. Marca como agotado lo que la tienda tenía en stock y no vino hoy
+--   4. Stamp de Stores.LastScrapedAt (crea la tienda si no existe)
+--
+-- Instalar una vez en el SQL Editor de Supabase y activar en el matcher con
+-- MATCH_SNAPSHOT_RPC=1. Usa el mismo índice único que el upsert del matcher:
+--   ProductPricing ("SpecId", "SpecTableName", "StoreId")
+--
+-- p_items: [{"SpecId": ..., "SpecTableName": ..., "Price": ..., "Url": ...}]
+-- Retorna: {"store_id", "upserted", "history": [{"SpecId", "SpecTableName"}],
+--           "out_of_stock": [{"SpecId", "SpecTableName"}]}
+--
+-- El sustituto local (SUPABASE_BACKEND=local) está en store_snapshot.py.
+
+create or replace function public.apply_store_snapshot(
+    p_store_name text,
+    p_items jsonb,
+    p_heartbeat_days integer default 0
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_store_id "Stores"."Id"%type;
+    v_now timestamp := now();
+    v_upserted integer;
+    v_history jsonb;
+    v_out_of_stock jsonb;
+begin
+    select "Id" into v_store_id from "Stores" where "Name" = p_store_name limit 1;
+    if v_store_id is null then
+        insert into "Stores" ("Name") values (p_store_name) returning "Id" into v_store_id;
+    end if;
+
+    -- Historial y upsert en una sola sentencia: ambos CTE ven ProductPricing
+    -- ANTES del upsert, así que el historial compara contra el estado anterior.
+    with snapshot as (
+        select distinct on (s."SpecId", s."SpecTableName")
+               s."SpecId", s."SpecTableName", s."Price", s."Url"
+        from jsonb_populate_recordset(null::"ProductPricing", p_items) s
+        order by s."SpecId", s."SpecTableName", s."Price"
+    ),
+    history as (
+        insert into "PriceHistory" ("SpecId", "SpecTableName", "StoreId", "Price", "RecordedAt")
+        select s."SpecId", s."SpecTableName", v_store_id, s."Price", v_now
+        from snapshot s
+        left join "ProductPricing" pp
+               on pp."SpecId" = s."SpecId"
+              and pp."SpecTableName" = s."SpecTableName"
+              and pp."StoreId" = v_store_id
+        where pp."SpecId" is null
+           or pp."Price" is distinct from s."Price"
+           or not coalesce(pp."StockStatus", false)
+           or (p_heartbeat_days > 0 and coalesce((
+                   select max(h."RecordedAt") from "PriceHistory" h
+                   where h."SpecId" = s."SpecId"
+                     and h."SpecTableName" = s."SpecTableName"
+                     and h."StoreId" = v_store_id
+               ), '-infinity') <= v_now - make_interval(days => p_heartbeat_days))
+        returning "SpecId", "SpecTableName"
+    ),
+    upserted as (
+        insert into "ProductPricing" ("SpecId", "SpecTableName", "StoreId", "Price", "StockStatus", "Url", "LastUpdated")
+        select s."SpecId", s."SpecTableName", v_store_id, s."Price", true, s."Url", v_now
+        from snapshot s
+        on conflict ("SpecId", "SpecTableName", "StoreId") do update
+            set "Price" = excluded."Price",
+                "StockStatus" = true,
+                "Url" = excluded."Url",
+                "LastUpdated" = excluded."LastUpdated"
+        returning 1
+    )
+    select (select count(*) from upserted),
+           coalesce((select jsonb_agg(jsonb_build_object('SpecId', "SpecId", 'SpecTableName', "SpecTableName")) from history), '[]'::jsonb)
+      into v_upserted, v_history;
+
+    -- Stock agotado: lo que estaba en stock y no vino en el snapshot
+    with flipped as (
+        update "ProductPricing" pp
+           set "StockStatus" = false, "LastUpdated" = v_now
+         where pp."StoreId" = v_store_id
+           and pp."StockStatus"
+           and not exists (
+               select 1
+               from jsonb_populate_recordset(null::"ProductPricing", p_items) s
+               where s."SpecId" = pp."SpecId" and s."SpecTableName" = pp."SpecTableName"
+           )
+        returning pp."SpecId", pp."SpecTableName"
+    )
+    select coalesce(jsonb_agg(jsonb_build_object('SpecId', "SpecId", 'SpecTableName', "SpecTableName")), '[]'::jsonb)
+      into v_out_of_stock
+      from flipped;
+
+    update "Stores" set "LastScrapedAt" = v_now where "Id" = v_store_id;
+
+    return jsonb_build_object(
+        'store_id', v_store_id,
+        'upserted', v_upserted,
+        'history', v_history,
+        'out_of_stock', v_out_of_stock
+    );
+end;
+$$;
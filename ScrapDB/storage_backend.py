@@ -0,0 +1,581 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid as uuid_lib
+from pathlib import Path
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_LOCAL_DB = BASE_DIR / "Cache" / "local_supabase.sqlite"
+
+_PLAIN_TYPES = (str, bytes, int, float, bool, dict, list, tuple, type(None))
+
+# Métodos que efectivamente hacen un request (HTTP en Supabase, SQL en local)
+_REQUEST_METHODS = {"execute", "upload"}
+
+# Métodos de la cadena fluida que definen la operación que se está armando
+_OPERATIONS = {"select", "insert", "upsert", "update", "delete", "rpc"}
+
+
+class LocalBackendError(Exception):
+    pass
+
+
+# ================= INSTRUMENTACIÓN =================
+
+class RequestStats:
+    """Contador de round trips y latencia por (operación, tabla)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.by_key = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, table, seconds):
+        key = (operation or "?", table or "?")
+        with self._lock:
+            entry = self.by_key.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    @property
+    def total_requests(self):
+        with self._lock:
+            return sum(entry[0] for entry in self.by_key.values())
+
+    def report(self, items=None):
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            rows = sorted(self.by_key.items(), key=lambda kv: kv[1][1], reverse=True)
+        total = sum(entry[0] for _, entry in rows)
+        total_latency = sum(entry[1] for _, entry in rows)
+        print("\n📊 Round trips al backend:")
+        for (operation, table), (count, seconds, worst) in rows:
+            print(
+                f"   {operation:<7} {table:<40} {count:>7} req | "
+                f"prom {seconds / count * 1000:7.1f} ms | máx {worst * 1000:7.1f} ms"
+            )
+        print(
+            f"   TOTAL: {total} req en {elapsed:.1f}s "
+            f"({total / elapsed if elapsed else 0:.1f} req/s, "
+            f"latencia acumulada {total_latency:.1f}s)"
+        )
+        if items:
+            print(f"   Items procesados: {items} ({items / elapsed if elapsed else 0:.1f} items/s)")
+
+
+class InstrumentedClient:
+    """
+    Proxy sobre un cliente estilo supabase-py (real o local). Cada `.execute()`
+    de la cadena fluida (table/schema/select/eq/upsert/...) y cada
+    `storage...upload()` pasa por el RateLimiter (si hay) y queda registrado
+    en RequestStats (si hay).
+    """
+
+    def __init__(self, target, limiter=None, stats=None, context=None):
+        self._target = target
+        self._limiter = limiter
+        self._stats = stats
+        self._context = context or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _REQUEST_METHODS:
+            def request(*args, **kwargs):
+                if self._limiter is not None:
+                    self._limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    if self._stats is not None:
+                        operation = self._context.get("operation") if name == "execute" else name
+                        self._stats.record(operation, self._context.get("table"), time.perf_counter() - started)
+            return request
+        if callable(attr):
+            def call(*args, **kwargs):
+                context = self._context
+                if name in ("table", "from_") and args:
+                    context = {**context, "table": args[0]}
+                elif name in _OPERATIONS:
+                    context = {**context, "operation": name}
+                    if name == "rpc" and args:
+                        context["table"] = args[0]
+                return self._wrap(attr(*args, **kwargs), context)
+            return call
+        return self._wrap(attr, self._context)
+
+    def _wrap(self, value, context):
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        return InstrumentedClient(value, self._limiter, self._stats, context)
+
+
+# ================= BACKEND LOCAL (SQLite) =================
+
+def _quote(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+class LocalResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class LocalBackend:
+    """
+    Sustituto local de Supabase sobre SQLite con la misma API fluida que usa el
+    matcher (table/schema/from_/select/eq/ilike/upsert/insert/update/rpc/storage).
+
+    Las tablas y columnas se crean a medida que aparecen. Cada tabla tiene una
+    columna "Id" que se autogenera (uuid) si el insert no la trae. Las listas y
+    dicts se guardan como JSON y los booleanos como 0/1; ambos se devuelven con
+    su tipo original al leer.
+    """
+
+    def __init__(self, db_path=DEFAULT_LOCAL_DB, latency_ms=0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.latency = latency_ms / 1000.0
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _column_kinds (tbl TEXT, col TEXT, kind TEXT, PRIMARY KEY (tbl, col))"
+        )
+        self.reload_schema_cache()
+        self.rpc_functions = {}
+        self.storage = LocalStorage(self.db_path.parent / f"{self.db_path.stem}_storage")
+
+    # --- API estilo supabase-py ---
+    def table(self, table_name):
+        return _LocalQuery(self, "public", table_name)
+
+    def from_(self, table_name):
+        return self.table(table_name)
+
+    def schema(self, schema_name):
+        return _LocalSchema(self, schema_name)
+
+    def rpc(self, function_name, params=None):
+        return _LocalRpc(self, function_name, params or {})
+
+    def register_rpc(self, function_name, implementation):
+        """`implementation(backend, params)` corre dentro de una transacción."""
+        self.rpc_functions[function_name] = implementation
+
+    # --- Utilidades internas ---
+    def reload_schema_cache(self):
+        """Relee columnas y tipos desde SQLite (p.ej. tras un ROLLBACK que revirtió un ALTER TABLE)."""
+        self._columns = {}
+        self._kinds = {}
+        for tbl, col, kind in self.conn.execute("SELECT tbl, col, kind FROM _column_kinds"):
+            self._kinds.setdefault(tbl, {})[col] = kind
+
+    def simulate_latency(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def table_key(schema_name, table_name):
+        return table_name if schema_name == "public" else f"{schema_name}.{table_name}"
+
+    def ensure_table(self, tbl):
+        if tbl in self._columns:
+            return
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(tbl)} (\"Id\" TEXT)")
+        self.conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote('ux_' + tbl + '_Id')} ON {_quote(tbl)} (\"Id\")"
+        )
+        self._columns[tbl] = {row[1] for row in self.conn.execute(f"PRAGMA table_info({_quote(tbl)})")}
+
+    def ensure_columns(self, tbl, columns, sample=None):
+        self.ensure_table(tbl)
+        known = self._columns[tbl]
+        for col in columns:
+            if col not in known:
+                self.conn.execute(f"ALTER TABLE {_quote(tbl)} ADD COLUMN {_quote(col)}")
+                known.add(col)
+            if sample is not None and col in sample:
+                self._remember_kind(tbl, col, sample[col])
+
+    def ensure_unique(self, tbl, columns):
+        self.ensure_columns(tbl, columns)
+        name = "ux_" + tbl + "_" + "_".join(columns)
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        self.conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(tbl)} ({cols_sql})")
+
+    def _remember_kind(self, tbl, col, value):
+        if isinstance(value, bool):
+            kind = "bool"
+        elif isinstance(value, (list, dict)):
+            kind = "json"
+        else:
+            return
+        kinds = self._kinds.setdefault(tbl, {})
+        if kinds.get(col) != kind:
+            kinds[col] = kind
+            self.conn.execute(
+                "INSERT OR REPLACE INTO _column_kinds (tbl, col, kind) VALUES (?, ?, ?)", (tbl, col, kind)
+            )
+
+    @staticmethod
+    def encode(value):
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def decode_row(self, tbl, row):
+        data = dict(row)
+        kinds = self._kinds.get(tbl, {})
+        for col, kind in kinds.items():
+            value = data.get(col)
+            if value is None:
+                continue
+            if kind == "bool":
+                data[col] = bool(value)
+            elif kind == "json" and isinstance(value, str):
+                data[col] = json.loads(value)
+        return data
+
+
+class _LocalSchema:
+    def __init__(self, backend, schema_name):
+        self.backend = backend
+        self.schema_name = schema_name
+
+    def from_(self, table_name):
+        return _LocalQuery(self.backend, self.schema_name, table_name)
+
+    def table(self, table_name):
+        return self.from_(table_name)
+
+    def rpc(self, function_name, params=None):
+        return _LocalRpc(self.backend, function_name, params or {})
+
+
+class _LocalRpc:
+    def __init__(self, backend, function_name, params):
+        self.backend = backend
+        self.function_name = function_name
+        self.params = params
+
+    def execute(self):
+        implementation = self.backend.rpc_functions.get(self.function_name)
+        if implementation is None:
+            raise LocalBackendError(f"Función RPC desconocida: {self.function_name}")
+        self.backend.simulate_latency()
+        with self.backend.lock:
+            conn = self.backend.conn
+            conn.execute("BEGIN")
+            try:
+                result = implementation(self.backend, self.params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                # La función puede haber creado tablas/columnas dentro de la transacción
+                self.backend.reload_schema_cache()
+                raise
+        return LocalResponse(result)
+
+
+class _LocalQuery:
+    def __init__(self, backend, schema_name, table_name):
+        self.backend = backend
+        self.tbl = LocalBackend.table_key(schema_name, table_name)
+        self.operation = None
+        self.columns = "*"
+        self.count_mode = None
+        self.payload = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+        self.filters = []
+        self.filter_columns = set()
+        self.negate_next = False
+        self.limit_value = None
+        self.offset_value = None
+        self.order_by = []
+
+    # --- Operaciones ---
+    def select(self, *columns, count=None):
+        self.operation = "select"
+        joined = ",".join(columns) if columns else "*"
+        self.columns = [c.strip() for c in joined.split(",") if c.strip()] if joined.strip() != "*" else "*"
+        self.count_mode = count
+        return self
+
+    def insert(self, json_data, **kwargs):
+        self.operation = "insert"
+        self.payload = json_data if isinstance(json_data, list) else [json_data]
+        return self
+
+    def upsert(self, json_data, on_conflict="", ignore_duplicates=False, **kwargs):
+        self.operation = "upsert"
+        self.payload = json_data if isinstance(json_data, list) else [json_data]
+        self.on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()] or ["Id"]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, json_data, **kwargs):
+        self.operation = "update"
+        self.payload = json_data
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    # --- Filtros ---
+    @property
+    def not_(self):
+        self.negate_next = True
+        return self
+
+    def _add_filter(self, column, sql, params):
+        if self.negate_next:
+            sql = f"NOT ({sql})"
+            self.negate_next = False
+        self.filters.append((sql, params))
+        self.filter_columns.add(column)
+        return self
+
+    def _compare(self, column, operator, value):
+        return self._add_filter(column, f"{_quote(column)} {operator} ?", [LocalBackend.encode(value)])
+
+    def eq(self, column, value):
+        return self._compare(column, "=", value)
+
+    def neq(self, column, value):
+        return self._compare(column, "!=", value)
+
+    def gt(self, column, value):
+        return self._compare(column, ">", value)
+
+    def gte(self, column, value):
+        return self._compare(column, ">=", value)
+
+    def lt(self, column, value):
+        return self._compare(column, "<", value)
+
+    def lte(self, column, value):
+        return self._compare(column, "<=", value)
+
+    def like(self, column, pattern):
+        return self._add_filter(column, f"{_quote(column)} GLOB ?", [pattern.replace("%", "*")])
+
+    def ilike(self, column, pattern):
+        # PostgREST acepta '*' como alias de '%'; LIKE de SQLite ya ignora mayúsculas (ASCII)
+        return self._add_filter(column, f"{_quote(column)} LIKE ?", [pattern.replace("*", "%")])
+
+    def is_(self, column, value):
+        if value is None or str(value).lower() == "null":
+            return self._add_filter(column, f"{_quote(column)} IS NULL", [])
+        return self._add_filter(column, f"{_quote(column)} = ?", [1 if str(value).lower() == "true" else 0])
+
+    def in_(self, column, values):
+        values = list(values)
+        if not values:
+            return self._add_filter(column, "0 = 1", [])
+        placeholders = ", ".join("?" for _ in values)
+        return self._add_filter(
+            column, f"{_quote(column)} IN ({placeholders})", [LocalBackend.encode(v) for v in values]
+        )
+
+    def contains(self, column, value):
+        """Arrays: la columna (JSON) contiene todos los elementos de `value`."""
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            return self._add_filter(column, "1 = 1", [])
+        clauses = " AND ".join(
+            f"EXISTS (SELECT 1 FROM json_each({_quote(column)}) WHERE json_each.value = ?)" for _ in values
+        )
+        return self._add_filter(column, f"({_quote(column)} IS NOT NULL AND {clauses})", list(values))
+
+    def overlaps(self, column, values):
+        """Arrays: la columna (JSON) comparte al menos un elemento con `values`."""
+        values = list(values)
+        if not values:
+            return self._add_filter(column, "0 = 1", [])
+        placeholders = ", ".join("?" for _ in values)
+        return self._add_filter(
+            column,
+            f"({_quote(column)} IS NOT NULL AND EXISTS (SELECT 1 FROM json_each({_quote(column)}) "
+            f"WHERE json_each.value IN ({placeholders})))",
+            values,
+        )
+
+    # --- Modificadores ---
+    def limit(self, size):
+        self.limit_value = size
+        return self
+
+    def range(self, start, end):
+        self.offset_value = start
+        self.limit_value = end - start + 1
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.order_by.append(f"{_quote(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    # --- Ejecución ---
+    def _where(self):
+        if not self.filters:
+            return "", []
+        params = []
+        for _, filter_params in self.filters:
+            params.extend(filter_params)
+        return " WHERE " + " AND ".join(sql for sql, _ in self.filters), params
+
+    def execute(self):
+        backend = self.backend
+        backend.simulate_latency()
+        with backend.lock:
+            backend.ensure_columns(self.tbl, self.filter_columns)
+            if self.operation in (None, "select"):
+                return self._execute_select()
+            if self.operation in ("insert", "upsert"):
+                return self._execute_write()
+            if self.operation == "update":
+                return self._execute_update()
+            if self.operation == "delete":
+                where, params = self._where()
+                rows = backend.conn.execute(f"DELETE FROM {_quote(self.tbl)}{where} RETURNING *", params).fetchall()
+                return LocalResponse([backend.decode_row(self.tbl, r) for r in rows])
+        raise LocalBackendError(f"Operación no soportada: {self.operation}")
+
+    def _execute_select(self):
+        backend = self.backend
+        if self.columns == "*":
+            cols_sql = "*"
+        else:
+            backend.ensure_columns(self.tbl, self.columns)
+            cols_sql = ", ".join(_quote(c) for c in self.columns)
+        where, params = self._where()
+        sql = f"SELECT {cols_sql} FROM {_quote(self.tbl)}{where}"
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(self.order_by)
+        if self.limit_value is not None:
+            sql += f" LIMIT {int(self.limit_value)}"
+            if self.offset_value:
+                sql += f" OFFSET {int(self.offset_value)}"
+        rows = backend.conn.execute(sql, params).fetchall()
+        count = None
+        if self.count_mode:
+            count = backend.conn.execute(f"SELECT COUNT(*) FROM {_quote(self.tbl)}{where}", params).fetchone()[0]
+        return LocalResponse([backend.decode_row(self.tbl, r) for r in rows], count)
+
+    def _execute_write(self):
+        backend = self.backend
+        conn = backend.conn
+        if self.operation == "upsert":
+            backend.ensure_unique(self.tbl, self.on_conflict)
+        # Columnas nuevas antes de abrir la transacción (ALTER TABLE no se revierte en el cache)
+        for row in self.payload:
+            backend.ensure_columns(self.tbl, row.keys(), sample=row)
+        result = []
+        conn.execute("BEGIN")
+        try:
+            for row in self.payload:
+                row = dict(row)
+                provided = list(row.keys())
+                if "Id" not in row:
+                    row["Id"] = str(uuid_lib.uuid4())
+                cols = list(row.keys())
+                sql = (
+                    f"INSERT INTO {_quote(self.tbl)} ({', '.join(_quote(c) for c in cols)}) "
+                    f"VALUES ({', '.join('?' for _ in cols)})"
+                )
+                if self.operation == "upsert":
+                    target = ", ".join(_quote(c) for c in self.on_conflict)
+                    updates = [c for c in provided if c not in self.on_conflict]
+                    if self.ignore_duplicates or not updates:
+                        sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    else:
+                        sets = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in updates)
+                        sql += f" ON CONFLICT ({target}) DO UPDATE SET {sets}"
+                sql += " RETURNING *"
+                try:
+                    rows = conn.execute(sql, [LocalBackend.encode(row[c]) for c in cols]).fetchall()
+                except sqlite3.IntegrityError as e:
+                    raise LocalBackendError(f"{self.tbl}: {e}") from e
+                result.extend(backend.decode_row(self.tbl, r) for r in rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return LocalResponse(result)
+
+    def _execute_update(self):
+        backend = self.backend
+        values = dict(self.payload)
+        backend.ensure_columns(self.tbl, values.keys(), sample=values)
+        sets = ", ".join(f"{_quote(c)} = ?" for c in values)
+        where, params = self._where()
+        rows = backend.conn.execute(
+            f"UPDATE {_quote(self.tbl)} SET {sets}{where} RETURNING *",
+            [LocalBackend.encode(v) for v in values.values()] + params,
+        ).fetchall()
+        return LocalResponse([backend.decode_row(self.tbl, r) for r in rows])
+
+
+class LocalStorage:
+    """Sustituto de Supabase Storage: un directorio por bucket."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def from_(self, bucket_name):
+        return _LocalBucket(self.root / bucket_name)
+
+
+class _LocalBucket:
+    def __init__(self, path):
+        self.path = path
+
+    def upload(self, path, file, file_options=None):
+        target = self.path / path
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        if target.exists() and not upsert:
+            raise LocalBackendError(f"El objeto ya existe: {path}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(file if isinstance(file, bytes) else Path(file).read_bytes())
+        return {"Key": str(target)}
+
+    def get_public_url(self, path):
+        return (self.path / path).resolve().as_uri()
+
+
+# ================= FÁBRICA =================
+
+def create_backend(url=None, key=None, limiter=None, stats=None):
+    """
+    Crea el cliente de datos según SUPABASE_BACKEND:
+    - "supabase" (por defecto): proyecto real, usando SUPABASE_URL / SUPABASE_KEY
+    - "local": SQLite en LOCAL_SUPABASE_DB (latencia simulada LOCAL_BACKEND_LATENCY_MS)
+    El cliente devuelto siempre pasa por InstrumentedClient.
+    """
+    kind = os.environ.get("SUPABASE_BACKEND", "supabase").strip().lower()
+    if kind == "local":
+        target = LocalBackend(
+            os.environ.get("LOCAL_SUPABASE_DB", DEFAULT_LOCAL_DB),
+            latency_ms=float(os.environ.get("LOCAL_BACKEND_LATENCY_MS", "0")),
+        )
+    elif kind == "supabase":
+        from supabase import create_client
+        url = url or os.environ.get("SUPABASE_URL")
+        key = key or os.environ.get("SUPABASE_KEY")
+        if not url or not key:
+            raise ValueError("❌ Faltan credenciales SUPABASE_URL o SUPABASE_KEY en .env")
+        target = create_client(url, key)
+    else:
+        raise ValueError(f"❌ SUPABASE_BACKEND desconocido: {kind!r} (usar 'supabase' o 'local')")
+    return InstrumentedClient(target, limiter=limiter, stats=stats)
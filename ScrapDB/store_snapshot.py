@@ -0,0 +1,139 @@
+import uuid as uuid_lib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# ================= CONFIGURACIÓN =================
+BASE_DIR = Path(__file__).resolve().parent
+
+# Función de Postgres (ver sql/apply_store_snapshot.sql)
+SNAPSHOT_FUNCTION = "apply_store_snapshot"
+SNAPSHOT_SQL_FILE = BASE_DIR / "sql" / "apply_store_snapshot.sql"
+
+
+def snapshot_params(store_name, unique_products, heartbeat_days=0):
+    """Arma los parámetros del RPC desde el dict deduplicado {spec_id: datos}."""
+    return {
+        "p_store_name": store_name,
+        "p_items": [
+            {
+                "SpecId": spec_id,
+                "SpecTableName": data["table"],
+                "Price": data["price_int"],
+                "Url": data["url"],
+            }
+            for spec_id, data in unique_products.items()
+        ],
+        "p_heartbeat_days": heartbeat_days,
+    }
+
+
+# ================= SUSTITUTO LOCAL (SQLite) =================
+
+def apply_store_snapshot_local(backend, params):
+    """
+    Misma semántica que sql/apply_store_snapshot.sql sobre LocalBackend.
+    Corre dentro de la transacción que abre el RPC local.
+    """
+    conn = backend.conn
+    store_name = params["p_store_name"]
+    items = params.get("p_items") or []
+    heartbeat_days = int(params.get("p_heartbeat_days") or 0)
+    now = datetime.now()
+    now_iso = now.isoformat()
+
+    backend.ensure_columns("Stores", ["Name", "LastScrapedAt"])
+    backend.ensure_unique("ProductPricing", ["SpecId", "SpecTableName", "StoreId"])
+    backend.ensure_columns(
+        "ProductPricing", ["Price", "StockStatus", "Url", "LastUpdated"], sample={"StockStatus": True}
+    )
+    backend.ensure_columns("PriceHistory", ["SpecId", "SpecTableName", "StoreId", "Price", "RecordedAt"])
+
+    row = conn.execute('SELECT "Id" FROM "Stores" WHERE "Name" = ? LIMIT 1', (store_name,)).fetchone()
+    if row is not None:
+        store_id = row[0]
+    else:
+        store_id = str(uuid_lib.uuid4())
+        conn.execute('INSERT INTO "Stores" ("Id", "Name") VALUES (?, ?)', (store_id, store_name))
+
+    # Snapshot en tabla temporal, deduplicado por precio mínimo
+    conn.execute(
+        'CREATE TEMP TABLE IF NOT EXISTS _snapshot '
+        '("SpecId" TEXT, "SpecTableName" TEXT, "Price" INTEGER, "Url" TEXT, PRIMARY KEY ("SpecId", "SpecTableName"))'
+    )
+    conn.execute('DELETE FROM temp._snapshot')
+    conn.executemany(
+        'INSERT INTO temp._snapshot ("SpecId", "SpecTableName", "Price", "Url") VALUES (?, ?, ?, ?) '
+        'ON CONFLICT ("SpecId", "SpecTableName") DO UPDATE SET "Price" = excluded."Price", "Url" = excluded."Url" '
+        'WHERE excluded."Price" < "Price"',
+        [(item["SpecId"], item["SpecTableName"], item["Price"], item.get("Url")) for item in items],
+    )
+
+    # 1. PriceHistory: se compara contra ProductPricing antes del upsert
+    cutoff = (now - timedelta(days=heartbeat_days)).isoformat()
+    changed = conn.execute(
+        '''
+        SELECT s."SpecId", s."SpecTableName", s."Price"
+        FROM temp._snapshot s
+        LEFT JOIN "ProductPricing" pp
+               ON pp."SpecId" = s."SpecId"
+              AND pp."SpecTableName" = s."SpecTableName"
+              AND pp."StoreId" = ?
+        WHERE pp."Id" IS NULL
+           OR pp."Price" IS NOT s."Price"
+           OR NOT COALESCE(pp."StockStatus", 0)
+           OR (? > 0 AND COALESCE((
+                   SELECT MAX(h."RecordedAt") FROM "PriceHistory" h
+                   WHERE h."SpecId" = s."SpecId"
+                     AND h."SpecTableName" = s."SpecTableName"
+                     AND h."StoreId" = ?
+               ), '') <= ?)
+        ''',
+        (store_id, heartbeat_days, store_id, cutoff),
+    ).fetchall()
+    conn.executemany(
+        'INSERT INTO "PriceHistory" ("Id", "SpecId", "SpecTableName", "StoreId", "Price", "RecordedAt") '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(str(uuid_lib.uuid4()), spec_id, table, store_id, price, now_iso) for spec_id, table, price in changed],
+    )
+
+    # 2. Upsert de ProductPricing
+    snapshot = conn.execute('SELECT "SpecId", "SpecTableName", "Price", "Url" FROM temp._snapshot').fetchall()
+    conn.executemany(
+        'INSERT INTO "ProductPricing" ("Id", "SpecId", "SpecTableName", "StoreId", "Price", "StockStatus", "Url", "LastUpdated") '
+        'VALUES (?, ?, ?, ?, ?, 1, ?, ?) '
+        'ON CONFLICT ("SpecId", "SpecTableName", "StoreId") DO UPDATE SET '
+        '"Price" = excluded."Price", "StockStatus" = 1, "Url" = excluded."Url", "LastUpdated" = excluded."LastUpdated"',
+        [(str(uuid_lib.uuid4()), spec_id, table, store_id, price, url, now_iso) for spec_id, table, price, url in snapshot],
+    )
+
+    # 3. Stock agotado
+    flipped = conn.execute(
+        '''
+        UPDATE "ProductPricing" SET "StockStatus" = 0, "LastUpdated" = ?
+        WHERE "StoreId" = ? AND "StockStatus"
+          AND NOT EXISTS (
+              SELECT 1 FROM temp._snapshot s
+              WHERE s."SpecId" = "ProductPricing"."SpecId" AND s."SpecTableName" = "ProductPricing"."SpecTableName"
+          )
+        RETURNING "SpecId", "SpecTableName"
+        ''',
+        (now_iso, store_id),
+    ).fetchall()
+
+    # 4. Stamp de la tienda
+    conn.execute('UPDATE "Stores" SET "LastScrapedAt" = ? WHERE "Id" = ?', (now_iso, store_id))
+
+    return {
+        "store_id": store_id,
+        "upserted": len(snapshot),
+        "history": [{"SpecId": spec_id, "SpecTableName": table} for spec_id, table, _ in changed],
+        "out_of_stock": [{"SpecId": spec_id, "SpecTableName": table} for spec_id, table in flipped],
+    }
+
+
+def register_local_snapshot_rpc(client):
+    """Registra el sustituto local si el cliente es LocalBackend. Retorna True si lo hizo."""
+    if not hasattr(client, "register_rpc"):
+        return False
+    client.register_rpc(SNAPSHOT_FUNCTION, apply_store_snapshot_local)
+    return True
@@ -1,65 +1,128 @@
-import os
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from spec_store import SpecStore
 
 # ==========================================
 # CONFIGURACIÓN
 # ==========================================
-# Carpeta donde están los JSONs ya scrapeados
-DATA_DIR = "SpecDB/ScrapedDataPCPP"
+load_dotenv()
+
+# Specs ya scrapeadas (empaquetadas por categoría, ver spec_store.py)
+spec_store = SpecStore()
 
 # Archivo que vamos a reconstruir
 OUTPUT_FILE = "SpecDB/ScrapDatabaseCache/pcpp_links.txt"
 
+# Links ya extraídos por categoría, con la firma (mtime:tamaño) del archivo
+# empaquetado: una categoría que no cambió no se vuelve a descomprimir
+LINKS_CACHE_FILE = "SpecDB/ScrapDatabaseCache/pcpp_links_cache.json"
+
+# Procesos para leer las categorías cambiadas (por defecto, uno por núcleo)
+REBUILD_WORKERS = int(os.environ.get("PCPP_REBUILD_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def extract_links(store_dir, category):
+    """
+    Worker del pool: lee una categoría y retorna (categoria, entrada) con
+    entrada = {"links": [...], "products": n, "unknown": n, "no_url": n}.
+    """
+    # La migración desde la carpeta legacy ya la hizo el proceso principal
+    store = SpecStore(store_dir=store_dir, auto_migrate=False)
+    links = set()
+    products = skipped_unknown = skipped_no_url = 0
+    for data in store.load(category):
+        products += 1
+
+        # 1. Obtener Nombre y URL
+        name = data.get("name", "Unknown Product")
+
+        # A veces se guarda como 'pcpartpicker_url' o 'url' dependiendo de la versión del script
+        url = data.get("pcpartpicker_url") or data.get("url")
+
+        # 2. Validaciones
+        if not url:
+            skipped_no_url += 1
+            continue
+
+        if name == "Unknown Product" or name == "Unknown":
+            skipped_unknown += 1
+            continue
+
+        links.add(url.strip())
+
+    return category, {
+        "links": sorted(links),
+        "products": products,
+        "unknown": skipped_unknown,
+        "no_url": skipped_no_url,
+    }
+
+
+def load_cache():
+    try:
+        with open(LINKS_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(LINKS_CACHE_FILE), exist_ok=True)
+    tmp_path = LINKS_CACHE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, LINKS_CACHE_FILE)
+
+
 def main():
-    if not os.path.exists(DATA_DIR):
-        print(f"❌ Error: No existe la carpeta de datos {DATA_DIR}")
+    categories = spec_store.categories()
+    if not categories:
+        print(f"❌ Error: No hay specs en {spec_store.store_dir} ni en {spec_store.legacy_dir}")
         return
 
-    print(f"📂 Escaneando archivos JSON en: {DATA_DIR}...")
+    print(f"📂 Escaneando specs en: {spec_store.store_dir}...")
+    started = time.perf_counter()
+
+    cache = load_cache()
+    signatures = {category: spec_store.signature(category) for category in categories}
+    changed = [c for c in categories if signatures[c] and cache.get(c, {}).get("signature") != signatures[c]]
+    # Las categorías más pesadas primero, para que no queden solas al final
+    changed.sort(key=lambda c: os.path.getsize(spec_store.path(c)), reverse=True)
+
+    parse_started = time.perf_counter()
+    parsed_products = 0
+    if changed:
+        print(f"⚡ {len(changed)} categorías cambiadas ({len(categories) - len(changed)} desde cache), "
+              f"{min(REBUILD_WORKERS, len(changed))} procesos.")
+        with ProcessPoolExecutor(max_workers=min(REBUILD_WORKERS, len(changed))) as executor:
+            futures = [executor.submit(extract_links, spec_store.store_dir, c) for c in changed]
+            for future in as_completed(futures):
+                category, entry = future.result()
+                entry["signature"] = signatures[category]
+                cache[category] = entry
+                parsed_products += entry["products"]
+    parse_seconds = time.perf_counter() - parse_started
+
+    # Categorías que ya no existen salen del cache
+    cache = {c: entry for c, entry in cache.items() if c in signatures and signatures[c]}
+    save_cache(cache)
 
     unique_links = set()
-    files_processed = 0
-    skipped_unknown = 0
-    skipped_no_url = 0
-
-    # Recorrer todas las subcarpetas
-    for root, dirs, files in os.walk(DATA_DIR):
-        for filename in files:
-            if filename.endswith(".json"):
-                file_path = os.path.join(root, filename)
-                files_processed += 1
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                        # 1. Obtener Nombre y URL
-                        name = data.get("name", "Unknown Product")
-                        
-                        # A veces se guarda como 'pcpartpicker_url' o 'url' dependiendo de la versión del script
-                        url = data.get("pcpartpicker_url") or data.get("url")
-
-                        # 2. Validaciones
-                        if not url:
-                            skipped_no_url += 1
-                            continue
-
-                        if name == "Unknown Product" or name == "Unknown":
-                            skipped_unknown += 1
-                            # print(f"   🔸 Saltando Unknown: {file_path}")
-                            continue
-
-                        # 3. Agregar al Set (automáticamente elimina duplicados)
-                        unique_links.add(url.strip())
-
-                except Exception as e:
-                    print(f"❌ Error leyendo {filename}: {e}")
+    files_processed = skipped_unknown = skipped_no_url = 0
+    for entry in cache.values():
+        unique_links.update(entry["links"])
+        files_processed += entry["products"]
+        skipped_unknown += entry["unknown"]
+        skipped_no_url += entry["no_url"]
 
     # ==========================================
     # GUARDAR RESULTADO
     # ==========================================
     print("\n💾 Guardando archivo reconstruido...")
-    
+
     # Asegurar que el directorio de salida existe
     os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
 
@@ -68,18 +131,22 @@ def main():
             # Ordenamos los links alfabéticamente para mantener el orden
             for link in sorted(unique_links):
                 f.write(link + "\n")
-        
+
+        elapsed = time.perf_counter() - started
         print(f"✅ ¡Éxito! Archivo generado en: {OUTPUT_FILE}")
         print("-" * 40)
         print(f"📊 Estadísticas:")
-        print(f"   - Archivos escaneados: {files_processed}")
+        print(f"   - Productos escaneados: {files_processed}")
         print(f"   - Links Únicos Válidos: {len(unique_links)}")
         print(f"   - Ignorados (Unknown): {skipped_unknown}")
         print(f"   - Ignorados (Sin URL): {skipped_no_url}")
+        print(f"   - Releídos: {parsed_products} productos de {len(changed)} categorías "
+              f"({parsed_products / parse_seconds if parse_seconds else 0:.0f} productos/s)")
+        print(f"   - Total: {elapsed:.1f}s ({files_processed / elapsed if elapsed else 0:.0f} productos/s)")
         print("-" * 40)
 
     except Exception as e:
         print(f"🔥 Error escribiendo el archivo de salida: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
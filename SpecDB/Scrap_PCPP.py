@@ -1,8 +1,11 @@
+import argparse
 import asyncio
 import os
-import json
-import random
 import hashlib
+from cloudflare_session import CloudflareSession, page_value
+from crawl_frontier import NEW, CHANGED, UNCHANGED, CrawlFrontier
+from pcpp_listing import listing_hash, parse_listing
+from spec_store import SpecStore
 from pydoll.browser import Chrome
 from pydoll.browser.options import ChromiumOptions
 from pydoll.constants import Key
@@ -11,15 +14,25 @@ from pydoll.constants import Key
 # CONFIGURACIÓN
 # ==========================================
 CACHE_DIR = "SpecDB/ScrapDatabaseCache"
-OUTPUT_DIR = "SpecDB/ScrapedDataPCPP"
+# Las specs se guardan empaquetadas por categoría (ver spec_store.py)
+spec_store = SpecStore()
 
+# Estado del crawl (SQLite WAL). Los .txt de versiones anteriores se importan
+# automáticamente si existen o cambiaron.
+FRONTIER_DB = f"{CACHE_DIR}/crawl_frontier.sqlite"
 VISITED_FILE = f"{CACHE_DIR}/pcpp_links.txt"
 LINKSTOVISIT_FILE = f"{CACHE_DIR}/pcpp_links_to_visit.txt"
+MAX_ATTEMPTS_PER_URL = 3
 
 
 MAX_CONCURRENT_TABS_COLLECTOR = 10  # Pestañas para buscar links
 MAX_CONCURRENT_TABS_SCRAPER = 6    # Pestañas para scrapear productos
 
+# Sesión con el challenge de Cloudflare ya resuelto (ver cloudflare_session.py)
+PCPP_HOME = "https://pcpartpicker.com"
+LISTING_TIMEOUT = 20   # Segundos máximos esperando que cargue la tabla de una categoría
+LISTING_LINKS_XPATH = "//tbody[@id='category_content']/tr//a"
+
 CATEGORY_URL_MAP = {
     "Case": "https://pcpartpicker.com/products/case/",
     "Case Fan": "https://pcpartpicker.com/products/case-fan/",
@@ -49,32 +62,51 @@ CATEGORY_URL_MAP = {
 
 # Asegurar directorios
 os.makedirs(CACHE_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # ==========================================
 # UTILIDADES
 # ==========================================
-def load_set_from_file(filename):
-    if os.path.exists(filename):
-        with open(filename, 'r', encoding='utf-8') as f:
-            return set(line.strip() for line in f if line.strip())
-    return set()
+def get_spec_key(url, category):
+    """Key estable del producto (el nombre que tenía su JSON en el formato por carpetas)."""
+    hash_obj = hashlib.md5(url.encode())
+    return f"{category}_{hash_obj.hexdigest()}"
+
+async def first_listing_link(page):
+    try:
+        links = await page.query(LISTING_LINKS_XPATH, find_all=True)
+        return links[0].get_attribute("href") if links else None
+    except:
+        return None
 
-def append_to_file(filename, text):
-    with open(filename, 'a', encoding='utf-8') as f:
-        f.write(text + "\n")
+async def wait_for_listing(page, previous_first=None):
+    """
+    La tabla de categorías se llena por JS: espera a que haya filas y, al
+    paginar, a que la primera cambie (en vez de dormir un tiempo fijo).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LISTING_TIMEOUT
+    while loop.time() < deadline:
+        first = await first_listing_link(page)
+        if first and first != previous_first:
+            return True
+        await asyncio.sleep(0.25)
+    return False
 
-def get_filename_from_url(url, category):
-    """Genera un nombre de archivo seguro usando hash para evitar caracteres raros."""
-    hash_obj = hashlib.md5(url.encode())
-    return f"{category}_{hash_obj.hexdigest()}.json"
+def harvest_listing(rows, category_name, frontier, stats):
+    """
+    Cosecha las filas de una página de la tabla: las URLs nuevas o con la fila
+    cambiada quedan pendientes (página de detalle). Los valores de la tabla no
+    se copian al registro: su texto no siempre tiene el formato de la página de
+    detalle, y una fila cambiada igual se vuelve a leer completa.
+    """
+    for row in rows:
+        stats[frontier.observe_listing(row["url"], category_name, listing_hash(row))] += 1
 
 # ==========================================
 # PARTE 1: RECOLECTOR DE LINKS (Tu código mejorado)
 # ==========================================
 async def getPagination(tab):
     try:
-        await asyncio.sleep(2)
         # Selector actualizado de paginación PCPP
         pagination = await tab.query("//ul[contains(@class, 'pagination')]//li/a", find_all=True)
         if not pagination:
@@ -91,13 +123,14 @@ async def getPagination(tab):
     except:
         return 1
 
-async def process_category_links(sem, browser, category_name, category_url, visited_links, links_to_visit):
+async def process_category_links(sem, session, category_name, category_url, frontier, stats):
     async with sem:
         print(f"🔵 [COLLECTOR] Iniciando: {category_name}")
-        page = await browser.new_tab()
+        page = await session.new_tab()
         try:
-            await page.go_to(category_url)
-            await asyncio.sleep(30) 
+            await session.go_to(page, category_url)
+            if not await wait_for_listing(page):
+                print(f"   ⚠️ {category_name}: la tabla no cargó en {LISTING_TIMEOUT}s.")
 
             total_pages = await getPagination(page)
             print(f"   📄 {category_name}: {total_pages} páginas detectadas.")
@@ -108,14 +141,27 @@ async def process_category_links(sem, browser, category_name, category_url, visi
                     try:
                         # Navegación por URL query params es más segura que clicks en PCPP
                         next_page_url = f"{category_url}#page={i}"
-                        await page.go_to(next_page_url)
-                        await asyncio.sleep(random.uniform(3, 5))
+                        previous_first = await first_listing_link(page)
+                        await session.go_to(page, next_page_url)
+                        if not await wait_for_listing(page, previous_first):
+                            print(f"   ⚠️ {category_name} Pág {i}: la tabla no cambió en {LISTING_TIMEOUT}s.")
                     except Exception as e:
                         print(f"   ❌ Error paginando {category_name}: {e}")
                         break
                 
-                # Extraer links de la tabla
-                links = await page.query("//tbody[@id='category_content']/tr//a", find_all=True)
+                # Filas de la tabla (specs incluidas) en un solo request del HTML
+                rows = parse_listing(await page_value(page, "page_source"))
+                if rows:
+                    page_stats = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
+                    harvest_listing(rows, category_name, frontier, page_stats)
+                    for name, count in page_stats.items():
+                        stats[name] += count
+                    print(f"   ➡ {category_name} Pág {i}: {page_stats[NEW]} nuevos | "
+                          f"{page_stats[CHANGED]} cambiados | {page_stats[UNCHANGED]} sin cambios.")
+                    continue
+
+                # La tabla no se pudo leer (¿cambió el HTML?): solo los links, como antes
+                links = await page.query(LISTING_LINKS_XPATH, find_all=True)
                 
                 new_count = 0
                 for link in links:
@@ -124,12 +170,10 @@ async def process_category_links(sem, browser, category_name, category_url, visi
                     
                     full_link = "https://pcpartpicker.com" + href.strip()
                     
-                    if full_link not in visited_links and full_link not in links_to_visit:
-                        links_to_visit.add(full_link)
-                        append_to_file(LINKSTOVISIT_FILE, full_link)
+                    if frontier.add(full_link, category_name):
                         new_count += 1
                 
-                print(f"   ➡ {category_name} Pág {i}: {new_count} nuevos links.")
+                print(f"   ➡ {category_name} Pág {i}: {new_count} nuevos links (sin specs de la tabla).")
 
         except Exception as e:
             print(f"🔥 Error en collector {category_name}: {e}")
@@ -139,25 +183,13 @@ async def process_category_links(sem, browser, category_name, category_url, visi
 # ==========================================
 # PARTE 2: SCRAPER DE PRODUCTOS (Nueva Lógica)
 # ==========================================
-async def scrape_product_details(sem, browser, url):
+async def scrape_product_details(sem, session, url, frontier):
     async with sem:
-        page = await browser.new_tab()
+        page = await session.new_tab()
         try:
-            
-            async with page.expect_and_bypass_cloudflare_captcha(
-            ):
-                await page.go_to(url)
-            
-            #await page.enable_auto_solve_cloudflare_captcha()
-            
-            #await page.go_to(url)
-            
-            await asyncio.sleep(random.uniform(5, 8)) # Espera humana
-            
-            #await page.disable_auto_solve_cloudflare_captcha()
-            
-            
-            
+            # Carga normal: el bypass solo corre si la página resulta ser un challenge
+            await session.go_to(page, url)
+
             try:
                 category = await page.query("/html/body/div[4]/div[1]/section/section/ol/li/a")
                 category = await category.text
@@ -200,10 +232,9 @@ async def scrape_product_details(sem, browser, url):
                                 txt = await li.text
                                 values_list.append(txt.strip())
                             
-                            # --- AQUÍ ESTÁ EL FORMATO QUE PEDISTE: "[Val1, Val2]" ---
-                            # Unimos con coma y envolvemos en corchetes
-                            formatted_list_string = f"[{', '.join(values_list)}]"
-                            specs[label_text] = formatted_list_string
+                            # Se guarda como lista real (antes "[Val1, Val2]"): un valor con
+                            # coma no se parte y "Part #" llega intacto a la columna de arreglo
+                            specs[label_text] = values_list
                             Found = True
                     except: 
                         continue
@@ -223,35 +254,34 @@ async def scrape_product_details(sem, browser, url):
 
             # 6. Guardar
             if Found:
-                cat_folder = os.path.join(OUTPUT_DIR, category.replace(" ", ""))
-                os.makedirs(cat_folder, exist_ok=True)
-
-                filename = get_filename_from_url(url, category)
-                filepath = os.path.join(cat_folder, filename)
-
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(final_data, f, ensure_ascii=False, indent=4)
+                spec_store.put(category.replace(" ", ""), get_spec_key(url, category), final_data)
 
                 # 7. Actualizar historial
-                append_to_file(VISITED_FILE, url)
+                frontier.mark_done(url, category)
                 print(f"✅ Guardado: {category} | {product_name[:30]}...")
             else:
+                frontier.mark_failed(url, "sin specs")
                 print(final_data)
         except Exception as e:
+            frontier.mark_failed(url, e)
             print(f"❌ Error scrapeando {url}: {e}")
         finally:
             await page.close()
 # ==========================================
 # ORQUESTADOR PRINCIPAL
 # ==========================================
-async def main():
-    visited_links = load_set_from_file(VISITED_FILE)
-    links_to_visit = load_set_from_file(LINKSTOVISIT_FILE)
-    
-    # Limpieza: Asegurar que no visitamos lo que ya está visitado
-    links_to_visit = links_to_visit - visited_links
-    
-    print(f"📊 Estado Inicial: {len(visited_links)} visitados | {len(links_to_visit)} pendientes.")
+async def main(refresh=False):
+    frontier = CrawlFrontier(FRONTIER_DB, max_attempts=MAX_ATTEMPTS_PER_URL)
+    for path, count in frontier.import_legacy_files(VISITED_FILE, LINKSTOVISIT_FILE).items():
+        print(f"📥 Importados {count} links desde {path}")
+
+    # Lo que quedó a medias en una ejecución cortada vuelve a la cola
+    recovered = frontier.recover_in_flight()
+    if recovered:
+        print(f"♻️  {recovered} links en curso de la ejecución anterior vuelven a pendientes.")
+
+    counts = frontier.counts()
+    print(f"📊 Estado Inicial: {counts['done']} visitados | {counts['pending']} pendientes | {counts['failed']} fallidos.")
 
     options = ChromiumOptions()
     options.headless = False
@@ -259,47 +289,59 @@ async def main():
     browser = Chrome(options=options)
     await browser.start()
     
+    # El challenge se resuelve una vez; las pestañas reciben las cookies de clearance
+    session = CloudflareSession(browser, PCPP_HOME)
     page = await browser.new_tab()
-    async with page.expect_and_bypass_cloudflare_captcha():
-        await page.go_to("https://pcpartpicker.com")
-    await asyncio.sleep(10) # Espera humana
+    await session.clear(page)
+    await page.close()
 
     # --- FASE 1: RECOLECTAR LINKS (Si hay pocas pendientes, buscamos más) ---
-    # Si tienes muchos pendientes, puedes comentar esta fase para solo procesar
-    if len(links_to_visit) < 1000: 
+    # Con --refresh se recorre siempre: es la forma barata de refrescar (una
+    # página cada ~100 productos) y de encolar solo lo nuevo o cambiado
+    if refresh or frontier.retryable_count() < 1000: 
         print("\n🚀 FASE 1: Buscando nuevos links en categorías...")
         sem_collector = asyncio.Semaphore(MAX_CONCURRENT_TABS_COLLECTOR)
+        stats = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
         tasks = []
         for cat_name, cat_url in CATEGORY_URL_MAP.items():
-            tasks.append(process_category_links(sem_collector, browser, cat_name, cat_url, visited_links, links_to_visit))
+            tasks.append(process_category_links(sem_collector, session, cat_name, cat_url, frontier, stats))
         
         if tasks:
             await asyncio.gather(*tasks)
-            # Recargar lista tras recolección
-            links_to_visit = load_set_from_file(LINKSTOVISIT_FILE) - visited_links
+            frontier.flush()
+        print(f"📋 Tablas: {stats[NEW]} nuevos | {stats[CHANGED]} cambiados (a detalle) | "
+              f"{stats[UNCHANGED]} sin cambios.")
 
     # --- FASE 2: PROCESAR PRODUCTOS (Scraping profundo) ---
-    print(f"\n🚀 FASE 2: Scrapeando {len(links_to_visit)} productos...")
+    print(f"\n🚀 FASE 2: Scrapeando {frontier.retryable_count()} productos...")
     
     sem_scraper = asyncio.Semaphore(MAX_CONCURRENT_TABS_SCRAPER)
     
-    # Convertir set a lista para iterar
-    pending_list = list(links_to_visit)
-    
-    # Procesar en chunks para no saturar la memoria con miles de tareas
+    # Procesar en chunks tomados de la frontera (quedan in-flight hasta terminar)
     chunk_size = 100 
-    for i in range(0, len(pending_list), chunk_size):
-        chunk = pending_list[i:i + chunk_size]
+    processed = 0
+    while True:
+        chunk = frontier.claim(chunk_size)
+        if not chunk:
+            break
         batch_tasks = []
         for url in chunk:
-            batch_tasks.append(scrape_product_details(sem_scraper, browser, url))
+            batch_tasks.append(scrape_product_details(sem_scraper, session, url, frontier))
         
         await asyncio.gather(*batch_tasks)
-        print(f"💤 Descanso preventivo tras bloque {i}...")
+        frontier.flush()
+        processed += len(chunk)
+        print(f"💤 Descanso preventivo tras bloque {processed}...")
         await asyncio.sleep(2) 
 
     await browser.stop()
-    print("\n🏁 Todo finalizado.")
+    counts = frontier.counts()
+    frontier.close()
+    print(f"\n🏁 Todo finalizado. {counts['done']} visitados | {counts['failed']} fallidos | "
+          f"{session.bypasses} bypasses de Cloudflare.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scraper de specs de PCPartPicker")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Recorre las tablas de categorías aunque haya muchos pendientes")
+    asyncio.run(main(refresh=parser.parse_args().refresh))
\ No newline at end of file